@@ -3,27 +3,84 @@
 
 """Module documentation goes here."""
 import argparse
+import os
+import signal
 import time
 
 from logzero import logger
 from ns0 import NS0
+from profiling import CycleProfiler
+
+# Cycles profiled on SIGUSR1 if ns0:profile_cycles isn't set
+PROFILE_CYCLES_DEFAULT = 5
 
 
 def main(args):
     """ Main entry point of the app """
     # Create ns0 object
     # At this point we compute our initial set of records
-    ns0 = NS0()
+    ns0 = NS0(config_dir=args.config_dir)
+
+    # Profile the next cycles when ns0:profile_cycles changes, or on SIGUSR1
+    profiler = CycleProfiler(
+        ns0.config.resolve("ns0:profile_dir"),
+        float(ns0.config.resolve("ns0:profile_sample_interval")),
+    )
+    profile_cycles = 0
+
+    def on_sigusr1(signum, frame):
+        cycles = int(ns0.config.resolve("ns0:profile_cycles") or 0)
+        profiler.request(cycles or PROFILE_CYCLES_DEFAULT)
+
+    signal.signal(signal.SIGUSR1, on_sigusr1)
+
+    # Log the negative cache on SIGUSR2, at the start of the next cycle
+    dump_negative = []
+
+    def on_sigusr2(signum, frame):
+        dump_negative.append(signum)
 
-    while True:
-        # ns0.providerUpdate()
-        ns0.guessEndpoints()
-        ns0.update()
-        ns0.clean()
-        logger.debug(
-            "Sleeping for {}s".format(ns0.config.resolve("ns0:update_interval"))
-        )
-        time.sleep(ns0.config.resolve("ns0:update_interval"))
+    signal.signal(signal.SIGUSR2, on_sigusr2)
+
+    try:
+        while True:
+            # Unset, or set to 0, resolves to None
+            cycles = int(ns0.config.resolve("ns0:profile_cycles") or 0)
+            if cycles != profile_cycles:
+                profile_cycles = cycles
+                profiler.request(cycles)
+
+            if dump_negative:
+                del dump_negative[:]
+                entries = ns0.negative.dump()
+                logger.info("Negative cache: %s entries", len(entries))
+                for entry in entries:
+                    logger.info(
+                        "%s %s: %s %s (expires in %ss, %s hits)",
+                        entry["scope"],
+                        entry["key"],
+                        entry["reason"],
+                        entry["detail"],
+                        entry["expires_in"],
+                        entry["hits"],
+                    )
+
+            with profiler.cycle():
+                # ns0.providerUpdate()
+                with profiler.phase("reload"):
+                    ns0.reload()
+                with profiler.phase("endpoints"):
+                    ns0.guessEndpoints()
+                with profiler.phase("update"):
+                    ns0.update()
+                with profiler.phase("clean"):
+                    ns0.clean()
+                with profiler.phase("flush"):
+                    ns0.flush()
+            logger.debug("Sleeping for %ss", ns0.config.resolve("ns0:update_interval"))
+            time.sleep(ns0.config.resolve("ns0:update_interval"))
+    finally:
+        ns0.close()
 
 
 if __name__ == "__main__":
@@ -38,6 +95,15 @@ if __name__ == "__main__":
     # Optional argument which requires a parameter (eg. -d test)
     PARSER.add_argument("-n", "--name", action="store", dest="name")
 
+    # Optional directory of ns0.yml / ns0_[provider].yml files, watched for changes
+    PARSER.add_argument(
+        "-c",
+        "--config-dir",
+        action="store",
+        dest="config_dir",
+        default=os.environ.get("NS0_CONFIG_DIR"),
+    )
+
     # Optional verbosity counter (eg. -v, -vv, -vvv, etc.)
     PARSER.add_argument(
         "-v", "--verbose", action="count", default=0, help="Verbosity (-v, -vv, etc)"
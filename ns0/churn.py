@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Record Docker container churn and replay it against ns0.
+
+The recorder captures the start and stop of containers carrying ns0 labels
+to a gzipped NDJSON trace. Hostnames and container IDs can be anonymised.
+    $ python ns0/churn.py record -o churn.ndjson.gz --anonymize --duration 3600
+
+The replay driver feeds a trace to a fake Docker client at N times real time.
+The full ns0 pipeline runs against it with a mock provider. For every trace
+it reports the convergence latency of the provider state and the number of
+provider calls.
+    $ python ns0/churn.py replay churn.ndjson.gz --speed 20
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import time
+
+import docker
+import tldextract
+from logzero import logger
+from ns0 import NS0
+from providers.docker import Docker
+
+TRACE_VERSION = 1
+
+# Addresses of the Endpoints during a replay (RFC 5737/3849 documentation ranges)
+REPLAY_ENDPOINTS = {
+    "private": {"ipv4": "192.0.2.1", "ipv6": "2001:db8::1"},
+    "public": {"ipv4": "198.51.100.1", "ipv6": "2001:db8::2"},
+    "ddns": {"ipv4": "198.51.100.1", "ipv6": "2001:db8::2"},
+    "local": {"ipv4": "127.0.0.1", "ipv6": "::1"},
+    "zerotier": {"ipv4": "203.0.113.1", "ipv6": "2001:db8::3"},
+}
+
+
+class Anonymizer:
+    """
+    Replace hostnames and container IDs by stable pseudonyms.
+    Hostnames keep their wildcard and their number of labels, so the shape of
+    the zones survives. Pseudonyms are keyed with a secret that is never
+    written, so they can't be reversed by hashing guessed names.
+    """
+
+    def __init__(self):
+        self._key = secrets.token_bytes(16)
+        self._containers = {}
+
+    def _digest(self, value):
+        return hashlib.blake2s(value.encode(), key=self._key, digest_size=4).hexdigest()
+
+    def hostname(self, hostname):
+        wildcard = hostname.startswith("*.")
+        labels = hostname[2:] if wildcard else hostname
+        parts = labels.split(".")
+        # example.com takes the place of the registered domain
+        names = [
+            "h{}".format(self._digest(".".join(parts[i:])))
+            for i in range(len(parts) - 2)
+        ]
+        return ("*." if wildcard else "") + ".".join(names + ["example", "com"])
+
+    def container(self, container_id):
+        if container_id not in self._containers:
+            self._containers[container_id] = "c{}".format(len(self._containers) + 1)
+        return self._containers[container_id]
+
+    def labels(self, labels):
+        return {
+            label: self.hostname(value) if label.endswith(".hostname") else value
+            for label, value in labels.items()
+        }
+
+
+def ns0_labels(labels):
+    """Return the ns0 labels of a container"""
+    return {
+        label: value
+        for label, value in (labels or {}).items()
+        if label.lower().startswith("ns0")
+    }
+
+
+def record(client, output, anonymize=False, duration=None):
+    """
+    Write the containers running now, then their start and stop events, to a
+    gzipped NDJSON trace. Records until `duration` seconds have passed, or
+    until interrupted. Returns the number of events written.
+    """
+    anonymizer = Anonymizer() if anonymize else None
+    started = time.monotonic()
+    written = 0
+
+    def event(action, container_id, labels=None):
+        entry = {"t": round(time.monotonic() - started, 3), "a": action}
+        entry["c"] = anonymizer.container(container_id) if anonymizer else container_id
+        if labels is not None:
+            entry["l"] = anonymizer.labels(labels) if anonymizer else labels
+        return json.dumps(entry, separators=(",", ":")) + "\n"
+
+    until = None
+    if duration:
+        until = datetime.datetime.now() + datetime.timedelta(seconds=duration)
+    # Subscribe before listing, so no event falls between the two
+    events = client.events(decode=True, filters={"type": "container"}, until=until)
+
+    with gzip.open(output, "wt") as stream:
+        stream.write(
+            json.dumps(
+                {
+                    "version": TRACE_VERSION,
+                    "recorded": datetime.datetime.now().isoformat(),
+                    "anonymized": anonymize,
+                }
+            )
+            + "\n"
+        )
+
+        running = set()
+        for container in client.containers.list():
+            labels = ns0_labels(container.labels)
+            if labels:
+                running.add(container.id)
+                stream.write(event("start", container.id, labels))
+                written += 1
+
+        try:
+            for docker_event in events:
+                action = docker_event.get("Action")
+                container_id = docker_event.get("Actor", {}).get("ID")
+                if action == "start":
+                    labels = ns0_labels(docker_event["Actor"].get("Attributes"))
+                    if labels:
+                        running.add(container_id)
+                        stream.write(event("start", container_id, labels))
+                        written += 1
+                elif action == "die" and container_id in running:
+                    running.discard(container_id)
+                    stream.write(event("stop", container_id))
+                    written += 1
+        except KeyboardInterrupt:
+            pass
+        finally:
+            events.close()
+
+    logger.info("Recorded %s events to %s", written, output)
+    return written
+
+
+def read_trace(path):
+    """Yield the events of a trace in order"""
+    with gzip.open(path, "rt") as stream:
+        header = json.loads(stream.readline())
+        if header.get("version") != TRACE_VERSION:
+            raise ValueError(
+                "Unsupported trace version {} in {}".format(header.get("version"), path)
+            )
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class FakeContainer:
+    def __init__(self, id, labels):
+        self.id = id
+        self.labels = labels
+
+
+class FakeContainers:
+    def __init__(self):
+        self.running = {}
+
+    def list(self):
+        return list(self.running.values())
+
+
+class FakeDockerClient:
+    """Stands in for docker.DockerClient, with the containers of a trace"""
+
+    def __init__(self):
+        self.containers = FakeContainers()
+
+    def apply(self, event):
+        if event["a"] == "start":
+            self.containers.running[event["c"]] = FakeContainer(event["c"], event["l"])
+        else:
+            self.containers.running.pop(event["c"], None)
+
+
+class MockSupervisor:
+    """
+    Stands in for the ProviderSupervisor. Keeps the published Record sets in
+    memory and counts the calls ns0 makes.
+    """
+
+    def __init__(self):
+        self.state = {}
+        self.calls = 0
+        self.changes = {"create": 0, "delete": 0}
+
+    def execute_rrset(self, provider_name, domain, name, changes):
+        if not changes:
+            return True
+        self.calls += 1
+        fqdn = "{}.{}".format(name, domain) if name else domain
+        values = self.state.setdefault(fqdn, set())
+        for (action, type, content) in changes:
+            self.changes[action] += 1
+            if action == "create":
+                values.add((type, content))
+            else:
+                values.discard((type, content))
+        if not values:
+            del self.state[fqdn]
+        return True
+
+    def execute(self, provider_name, action, domain, name, type, content):
+        changes = [(action, type, content)]
+        return self.execute_rrset(provider_name, domain, name, changes)
+
+    def close(self):
+        pass
+
+
+class ReplayNS0(NS0):
+    """
+    ns0 running on the virtual clock of a replay, without network access.
+    Health checks aren't probed, all values count as healthy.
+    """
+
+    _extract = tldextract.TLDExtract(
+        suffix_list_urls=None, include_psl_private_domains=True
+    )
+
+    def __init__(self, clock, config_dir=None):
+        self.clock = clock
+        self.client = FakeDockerClient()
+        super(ReplayNS0, self).__init__(
+            config_dir,
+            sync=False,
+            docker=Docker(client=self.client),
+            supervisor=MockSupervisor(),
+        )
+
+    def now(self):
+        return self.clock()
+
+    def guessEndpoints(self):
+        return {"endpoints": REPLAY_ENDPOINTS}
+
+    def guessDomain(self, hostname):
+        return self._extract(hostname)
+
+    def guessProvider(self, hostname):
+        return ["mock"]
+
+    def hasAuthToken(self, provider_name):
+        return True
+
+    def healthyValues(self, hostname, check, values):
+        return values
+
+    def desired(self):
+        """Expected Record sets of the running containers, first come first served"""
+        state = {}
+        for record in self.docker.getRecords().values():
+            if "hostname" in record and record["hostname"] not in state:
+                state[record["hostname"]] = set(
+                    self.resolveValues(record.get("endpoints", []))
+                )
+        return {hostname: values for hostname, values in state.items() if values}
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def replay(path, speed=10.0, config_dir=None, settle=None):
+    """
+    Replay a trace against ns0 at `speed` times real time. A speed of 0 runs
+    as fast as possible. After the last event, ns0 keeps running for `settle`
+    seconds (virtual time) or until the provider state has converged.
+    Returns a report dict.
+    """
+    start = datetime.datetime.now()
+    virtual = [0.0]
+    ns0 = ReplayNS0(lambda: start + datetime.timedelta(seconds=virtual[0]), config_dir)
+    interval = float(ns0.config.resolve("ns0:update_interval"))
+    ttl = float(ns0.config.resolve("ns0:ttl"))
+    if settle is None:
+        # Long enough for Records of stopped containers to expire
+        settle = 2 * (ttl + interval) + 10
+
+    events = read_trace(path)
+    upcoming = next(events, None)
+    # Events waiting for the provider state: [time, hostnames]
+    outstanding = []
+    latencies = []
+    count = 0
+    cycles = 0
+    next_cycle = 0.0
+    end = None
+    real_start = time.monotonic()
+
+    try:
+        while True:
+            while upcoming is not None and upcoming["t"] <= virtual[0]:
+                running = ns0.client.containers.running.get(upcoming["c"])
+                labels = upcoming.get("l") or (running.labels if running else {})
+                hostnames = {
+                    value
+                    for label, value in labels.items()
+                    if label.endswith(".hostname")
+                }
+                ns0.client.apply(upcoming)
+                outstanding.append([upcoming["t"], hostnames])
+                count += 1
+                upcoming = next(events, None)
+                if upcoming is None:
+                    end = virtual[0] + settle
+
+            if virtual[0] >= next_cycle:
+                ns0.update()
+                ns0.clean()
+                ns0.flush()
+                cycles += 1
+                next_cycle += interval
+
+                desired = ns0.desired()
+                published = ns0.supervisor.state
+                for entry in list(outstanding):
+                    entry[1] = {
+                        hostname
+                        for hostname in entry[1]
+                        if desired.get(hostname) != published.get(hostname)
+                    }
+                    if not entry[1]:
+                        latencies.append(virtual[0] - entry[0])
+                        outstanding.remove(entry)
+
+            if upcoming is None and (not outstanding or virtual[0] >= end):
+                break
+
+            # Advance to the next event or cycle
+            step = next_cycle
+            if upcoming is not None:
+                step = min(step, upcoming["t"])
+            if speed:
+                real = real_start + step / speed
+                time.sleep(max(0.0, real - time.monotonic()))
+            virtual[0] = max(virtual[0], step)
+    finally:
+        ns0.close()
+
+    report = {
+        "trace": path,
+        "events": count,
+        "cycles": cycles,
+        "duration": round(virtual[0], 3),
+        "calls": ns0.supervisor.calls,
+        "changes": ns0.supervisor.changes,
+        "converged": len(latencies),
+        "unconverged": len(outstanding),
+        "latency": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "max": max(latencies) if latencies else None,
+        },
+    }
+    logger.info(
+        "Replayed %s events of %s in %s cycles: %s provider calls, "
+        "%s unconverged, p95 convergence latency %ss",
+        count,
+        path,
+        cycles,
+        report["calls"],
+        report["unconverged"],
+        report["latency"]["p95"],
+    )
+    return report
+
+
+def main(args):
+    """ Main entry point of the churn tool """
+    if args.command == "record":
+        record(docker.from_env(), args.output, args.anonymize, args.duration)
+    else:
+        for path in args.paths:
+            report = replay(path, args.speed, args.config_dir, args.settle)
+            print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    COMMANDS = PARSER.add_subparsers(dest="command")
+    COMMANDS.required = True
+
+    RECORD = COMMANDS.add_parser("record", help="Record container events to a trace")
+    RECORD.add_argument("-o", "--output", default="ns0-trace.ndjson.gz")
+    RECORD.add_argument(
+        "--anonymize",
+        action="store_true",
+        default=False,
+        help="Replace hostnames and container IDs by pseudonyms",
+    )
+    RECORD.add_argument(
+        "--duration", type=float, default=None, help="Seconds to record for"
+    )
+
+    REPLAY = COMMANDS.add_parser("replay", help="Replay traces against ns0")
+    REPLAY.add_argument("paths", nargs="+")
+    REPLAY.add_argument(
+        "--speed", type=float, default=10.0, help="Times real time, 0 for no delays"
+    )
+    REPLAY.add_argument(
+        "--settle", type=float, default=None, help="Seconds to run after the trace"
+    )
+    REPLAY.add_argument(
+        "-c",
+        "--config-dir",
+        action="store",
+        dest="config_dir",
+        default=os.environ.get("NS0_CONFIG_DIR"),
+    )
+
+    MYARGS = PARSER.parse_args()
+    main(MYARGS)
@@ -10,6 +10,11 @@ import warnings
 
 import yaml
 from logzero import logger
+from watch import DirectoryWatcher
+
+# Naming convention of configuration files in a config directory:
+# 'ns0.yml' for ns0 itself, 'ns0_[provider].yml' for a DNS provider
+CONFIG_FILE_PATTERN = r"^ns0(?:_(\w+)|)\.yml$"
 
 
 class ConfigResolver(object):  # pylint: disable=useless-object-inheritance
@@ -74,6 +79,44 @@ class ConfigResolver(object):  # pylint: disable=useless-object-inheritance
         rank = position if position is not None else len(self._config_sources)
         self._config_sources.insert(rank, config_source)
 
+    def replace_config_source(self, old_source, new_source):
+        """
+        Replace a config source by another one, keeping its priority.
+        The list of sources is swapped as a whole, so concurrent calls to
+        resolve() either see the old or the new source, never a mix.
+        """
+        config_sources = list(self._config_sources)
+        config_sources[config_sources.index(old_source)] = new_source
+        self._config_sources = config_sources
+
+    def remove_config_source(self, config_source):
+        """Remove a config source from the current ConfigResolver instance."""
+        self._config_sources = [
+            source for source in self._config_sources if source is not config_source
+        ]
+
+    def config_sources(self):
+        """Return the configured sources, in decreasing priority order."""
+        return list(self._config_sources)
+
+    def scoped(self, scope):
+        """
+        Return every parameter directly below the given scope as a dict,
+        across all sources that can enumerate their parameters.
+        For instance:
+            * config.scoped('ns0:cloudflare') returns
+            {'auth_token': 'SECRET_TOKEN', 'auth_username': 'USERNAME'}
+        Values of higher priority sources win, like in resolve(), but unlike
+        resolve(), values such as 0 or False are kept. Only None and empty
+        strings are skipped.
+        """
+        options = {}
+        for config_source in reversed(self._config_sources):
+            for (key, value) in config_source.scoped(scope).items():
+                if value is not None and value != "":
+                    options[key] = value
+        return options
+
     def with_config_source(self, config_source):
         """
         Configure current resolver to use the provided ConfigSource instance
@@ -173,7 +216,7 @@ class ConfigResolver(object):  # pylint: disable=useless-object-inheritance
             path = os.path.join(dir_path, path)
             if os.path.isfile(path):
                 basename = os.path.basename(path)
-                search = re.search(r"^ns0(?:_(\w+)|)\.yml$", basename)
+                search = re.search(CONFIG_FILE_PATTERN, basename)
                 if search:
                     provider = search.group(1)
                     if provider:
@@ -222,6 +265,14 @@ class ConfigSource(
             "must be implemented in the concret sub-classes."
         )
 
+    def scoped(self, scope):  # pylint: disable=unused-argument,no-self-use
+        """
+        Return the parameters directly below the given scope (like
+        'ns0:cloudflare') as a dict keyed by their last name. Sources that
+        can't enumerate their parameters return an empty dict.
+        """
+        return {}
+
 
 class EnvironmentConfigSource(ConfigSource):  # pylint: disable=too-few-public-methods
     """ConfigSource that resolve configuration against existing environment variables"""
@@ -263,6 +314,15 @@ class EnvironmentConfigSource(ConfigSource):  # pylint: disable=too-few-public-m
 
         return None
 
+    def scoped(self, scope):
+        #   * ns0:provider => NS0_PROVIDER_AUTH_TOKEN gives auth_token
+        prefix = "{}_".format(re.sub(":", "_", scope).upper())
+        return {
+            key[len(prefix) :].lower(): value
+            for (key, value) in self._parameters.items()
+            if key.startswith(prefix)
+        }
+
 
 class ArgsConfigSource(ConfigSource):  # pylint: disable=too-few-public-methods
     """ConfigSource that resolve configuration against an argparse namespace."""
@@ -298,13 +358,41 @@ class DictConfigSource(ConfigSource):  # pylint: disable=too-few-public-methods
 
         return cursor.get(splitted_config_key[-1], None)
 
+    def flatten(self):
+        """
+        Return every parameter of this source as a flat dict, whose keys are
+        scoped config keys like 'ns0:cloudflare:auth_token'.
+        """
+        flat = {}
+        stack = [("ns0", self._parameters)]
+        while stack:
+            prefix, cursor = stack.pop()
+            for (key, value) in cursor.items():
+                config_key = "{}:{}".format(prefix, key)
+                if isinstance(value, dict):
+                    stack.append((config_key, value))
+                else:
+                    flat[config_key] = value
+        return flat
+
+    def scoped(self, scope):
+        cursor = self._parameters
+        for current in scope.split(":")[1:]:
+            cursor = cursor.get(current, {})
+            if not isinstance(cursor, dict):
+                return {}
+        return {
+            key: value for (key, value) in cursor.items() if not isinstance(value, dict)
+        }
+
 
 class FileConfigSource(DictConfigSource):  # pylint: disable=too-few-public-methods
     """ConfigSource that resolve configuration against a lexicon config file."""
 
     def __init__(self, file_path):
+        self.file_path = file_path
         with open(file_path, "r") as stream:
-            yaml_object = yaml.load(stream) or {}
+            yaml_object = yaml.safe_load(stream) or {}
 
         super(FileConfigSource, self).__init__(yaml_object)
 
@@ -362,6 +450,99 @@ class LegacyDictConfigSource(
         super(LegacyDictConfigSource, self).__init__(refactor_dict_object)
 
 
+class ConfigDirWatcher(object):  # pylint: disable=useless-object-inheritance
+    """
+    Load the configuration files of a directory into a ConfigResolver, and keep
+    them in sync with the files on disk.
+    Files follow the naming convention of ConfigResolver.with_config_dir().
+    Each call to reload() re-parses only the files that changed, swaps their
+    sources in the resolver and returns the set of config keys whose value
+    changed, so that consumers can re-evaluate what depends on them.
+    Example:
+        $ config = ConfigResolver().with_env()
+        $ watcher = ConfigDirWatcher(config, '/etc/ns0')
+        $ config.with_dict({'ttl': 10})
+        ...
+        $ changed_keys = watcher.reload()
+    """
+
+    def __init__(self, config_resolver, dir_path):
+        super(ConfigDirWatcher, self).__init__()
+        self._resolver = config_resolver
+        self._watcher = DirectoryWatcher(dir_path, CONFIG_FILE_PATTERN)
+        self._sources = {}
+
+        # New files are inserted where the directory was loaded initially,
+        # so they keep the priority of the config directory.
+        self._position = len(config_resolver.config_sources())
+
+        for path in self._watcher.paths():
+            source = self._load(path)
+            if source is not None:
+                self._resolver.add_config_source(source, self._anchor())
+                self._sources[path] = source
+
+    def _anchor(self):
+        sources = self._resolver.config_sources()
+        for (rank, source) in enumerate(sources):
+            if source in self._sources.values():
+                return rank
+        return min(self._position, len(sources))
+
+    @staticmethod
+    def _load(path):
+        provider = re.search(CONFIG_FILE_PATTERN, os.path.basename(path)).group(1)
+        try:
+            if provider:
+                return ProviderFileConfigSource(provider, path)
+            return FileConfigSource(path)
+        except (OSError, yaml.YAMLError) as e:
+            logger.error("Couldn't load configuration file %s: %s", path, e)
+            return None
+
+    def reload(self):
+        """
+        Re-parse the changed configuration files.
+        Return the set of config keys that changed their value.
+        """
+        changed_keys = set()
+
+        for path in sorted(self._watcher.changes()):
+            old_source = self._sources.get(path)
+            new_source = self._load(path) if os.path.isfile(path) else None
+
+            if new_source is None and os.path.isfile(path):
+                # Keep the last good version of a file that fails to parse
+                continue
+
+            old_values = old_source.flatten() if old_source else {}
+            new_values = new_source.flatten() if new_source else {}
+
+            if old_source and new_source:
+                self._resolver.replace_config_source(old_source, new_source)
+            elif new_source:
+                self._resolver.add_config_source(new_source, self._anchor())
+            elif old_source:
+                self._resolver.remove_config_source(old_source)
+
+            if new_source:
+                self._sources[path] = new_source
+            else:
+                self._sources.pop(path, None)
+
+            changed_keys.update(
+                key
+                for key in set(old_values) | set(new_values)
+                if old_values.get(key) != new_values.get(key)
+            )
+            logger.info("Reloaded configuration file %s", path)
+
+        return changed_keys
+
+    def close(self):
+        self._watcher.close()
+
+
 def non_interactive_config_resolver():
     """
     Create a typical config resolver in a non-interactive context
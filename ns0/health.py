@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Health checks of Record Endpoints.
+
+Containers can declare a check for a Record with a label:
+    ns0.traefik.healthcheck=tcp:443
+    ns0.traefik.healthcheck=http:8080/healthz
+Checks run on an asyncio event loop in a background thread with bounded
+concurrency. The main loop only reads cached results and never waits for
+a probe.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from logzero import logger
+
+# Targets that weren't asked for during this many intervals are forgotten
+EVICT_INTERVALS = 3
+
+
+def parse_check(value):
+    """
+    Parse a healthcheck label value into a check dict, e.g.
+    'http:8080/healthz' -> {'type': 'http', 'port': 8080, 'path': '/healthz'}.
+    Returns None for values that aren't a valid check.
+    """
+    type, _, target = value.strip().partition(":")
+    port, slash, path = target.partition("/")
+    type = type.lower()
+    if type not in ("tcp", "http") or not port.isdigit():
+        logger.warning("Ignoring invalid healthcheck %s", value)
+        return None
+    check = {"type": type, "port": int(port)}
+    if type == "http":
+        check["path"] = slash + path if slash else "/"
+    return check
+
+
+class HealthProber:
+    """
+    Probe (check, address) targets in the background and cache the results.
+    status() returns the last known result and schedules a new probe when the
+    cached one is older than `interval` seconds. Targets that status() wasn't
+    called for within EVICT_INTERVALS intervals, e.g. of stopped containers,
+    are evicted and no longer reported by metrics().
+    """
+
+    def __init__(self, concurrency=100, interval=10, timeout=2):
+        self.concurrency = concurrency
+        self.interval = interval
+        self.timeout = timeout
+
+        # (type, port, path, address) -> (healthy, checked, latency)
+        self._results = {}
+        # (type, port, path, address) -> last time status() was called
+        self._queried = {}
+        self._evicted = time.monotonic()
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._semaphore = None
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="ns0-health", daemon=True
+        )
+        self._thread.start()
+
+    @staticmethod
+    def _key(check, address):
+        return (check["type"], check["port"], check.get("path"), address)
+
+    def status(self, check, address):
+        """
+        Return True/False for the last probe of `address` with `check`,
+        or None if it hasn't been probed yet. Never blocks.
+        """
+        key = self._key(check, address)
+        now = time.monotonic()
+        with self._lock:
+            self._queried[key] = now
+            if now - self._evicted >= self.interval:
+                self._evict(now)
+            result = self._results.get(key)
+            stale = result is None or now - result[1] >= self.interval
+            if stale and key not in self._inflight:
+                self._inflight.add(key)
+                asyncio.run_coroutine_threadsafe(self._probe(key), self._loop)
+        return result[0] if result else None
+
+    async def _probe(self, key):
+        if self._semaphore is None:
+            # Created here, so it belongs to the prober's loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        type, port, path, address = key
+        async with self._semaphore:
+            start = time.monotonic()
+            try:
+                healthy = await asyncio.wait_for(
+                    self._check(type, address, port, path), self.timeout
+                )
+            except (OSError, asyncio.TimeoutError, ValueError):
+                healthy = False
+            latency = time.monotonic() - start
+
+        with self._lock:
+            previous = self._results.get(key)
+            self._inflight.discard(key)
+            if key not in self._queried:
+                # Evicted while being probed
+                return
+            self._results[key] = (healthy, time.monotonic(), latency)
+
+        if previous is not None and previous[0] != healthy:
+            logger.info(
+                "%s Endpoint %s %s:%s is %s",
+                "✓" if healthy else "✗",
+                address,
+                type,
+                port,
+                "healthy" if healthy else "unhealthy",
+            )
+
+    @staticmethod
+    async def _check(type, address, port, path):
+        reader, writer = await asyncio.open_connection(address, port)
+        try:
+            if type == "tcp":
+                return True
+            writer.write(
+                "GET {} HTTP/1.0\r\nHost: {}\r\n\r\n".format(path, address).encode()
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            status = status_line.split()
+            return len(status) >= 2 and status[1][:1] in (b"2", b"3")
+        finally:
+            writer.close()
+
+    def _evict(self, now):
+        """Forget the targets not asked for recently. Called with the lock held."""
+        self._evicted = now
+        horizon = now - EVICT_INTERVALS * self.interval
+        for key, queried in list(self._queried.items()):
+            if queried < horizon:
+                del self._queried[key]
+                self._results.pop(key, None)
+
+    def metrics(self):
+        """Return {target: (healthy, latency in seconds)} of every live probe"""
+        with self._lock:
+            self._evict(time.monotonic())
+            results = dict(self._results)
+        return {
+            "{}:{}:{}{}".format(type, address, port, path or ""): (healthy, latency)
+            for (type, port, path, address), (healthy, _, latency) in results.items()
+        }
+
+    def export(self, path):
+        """Write probe results and latencies in Prometheus text format"""
+        lines = [
+            "# TYPE ns0_healthcheck_up gauge\n",
+            "# TYPE ns0_healthcheck_latency_seconds gauge\n",
+        ]
+        for target, (healthy, latency) in sorted(self.metrics().items()):
+            lines.append(
+                'ns0_healthcheck_up{{target="{}"}} {}\n'.format(target, int(healthy))
+            )
+            lines.append(
+                'ns0_healthcheck_latency_seconds{{target="{}"}} {:.6f}\n'.format(
+                    target, latency
+                )
+            )
+
+        tmp_path = "{}.tmp".format(path)
+        with open(tmp_path, "w") as stream:
+            stream.writelines(lines)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
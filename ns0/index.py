@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hostname index of ns0.
+
+Hostnames are stored in a trie keyed by their labels in reverse order, so
+'web.here.ns0.co' lives under co -> ns0 -> here -> web. Exact and wildcard
+lookups cost one step per label, and every name below a zone is found in
+the zone's subtree.
+"""
+
+
+class _Node:
+    __slots__ = ("children", "record", "claims")
+
+    def __init__(self):
+        self.children = {}
+        self.record = None
+        # source key -> (generation, endpoints)
+        self.claims = {}
+
+
+def _labels(hostname):
+    return reversed(hostname.rstrip(".").lower().split("."))
+
+
+class HostnameIndex:
+    """
+    Reversed-label trie mapping hostnames (including wildcards such as
+    '*.here.ns0.co') to their records.
+
+    Besides lookups, the index tracks which source claims which Endpoints for
+    a hostname, to detect sources that disagree about the same name.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, hostname):
+        return self.get(hostname) is not None
+
+    def _find(self, hostname, create=False):
+        node = self._root
+        for label in _labels(hostname):
+            child = node.children.get(label)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[label] = _Node()
+            node = child
+        return node
+
+    def add(self, hostname, record):
+        """Add or replace the record of a hostname"""
+        node = self._find(hostname, create=True)
+        if node.record is None:
+            self._size += 1
+        node.record = record
+
+    def remove(self, hostname):
+        """Remove a hostname, its record and its claims. Empty branches are pruned."""
+        path = [self._root]
+        for label in _labels(hostname):
+            node = path[-1].children.get(label)
+            if node is None:
+                return False
+            path.append(node)
+
+        node = path[-1]
+        removed = node.record is not None
+        if removed:
+            self._size -= 1
+        node.record = None
+        node.claims = {}
+
+        labels = list(_labels(hostname))
+        for depth in range(len(labels), 0, -1):
+            node = path[depth]
+            if node.record is not None or node.children or node.claims:
+                break
+            del path[depth - 1].children[labels[depth - 1]]
+        return removed
+
+    def get(self, hostname):
+        """Return the record stored for exactly this hostname, or None"""
+        node = self._find(hostname)
+        return node.record if node else None
+
+    def match(self, hostname):
+        """
+        Return (matched_hostname, record) for a query name, or (None, None).
+        An exact match wins. Otherwise the wildcard directly below the closest
+        existing ancestor applies, like DNS wildcards (RFC 4592):
+        '*.here.ns0.co' answers 'a.here.ns0.co' and 'b.a.here.ns0.co'.
+        """
+        labels = list(_labels(hostname))
+        node = self._root
+        depth = 0
+        for label in labels:
+            child = node.children.get(label)
+            if child is None:
+                break
+            node = child
+            depth += 1
+
+        if depth == len(labels):
+            if node.record is not None:
+                return hostname.rstrip(".").lower(), node.record
+            # Names that exist only as parents of other names aren't
+            # answered by wildcards
+            return None, None
+
+        wildcard = node.children.get("*")
+        if wildcard is not None and wildcard.record is not None:
+            suffix = list(reversed(labels[:depth]))
+            return ".".join(["*"] + suffix), wildcard.record
+        return None, None
+
+    def under(self, zone):
+        """Yield (hostname, record) for every name in the given zone"""
+        node = self._find(zone)
+        if node is None:
+            return
+        stack = [(node, list(reversed(list(_labels(zone)))))]
+        while stack:
+            node, labels = stack.pop()
+            if node.record is not None:
+                yield ".".join(labels), node.record
+            for label, child in node.children.items():
+                stack.append((child, [label] + labels))
+
+    def group(self, zones):
+        """Group indexed hostnames by the given zones, e.g. for batching"""
+        return {zone: [hostname for hostname, _ in self.under(zone)] for zone in zones}
+
+    def claim(self, hostname, source, endpoints, generation=0):
+        """
+        Record that `source` wants `endpoints` for `hostname`.
+        Claims from earlier generations are stale and ignored.
+        Returns the sources of the current generation that claim
+        different Endpoints for the same hostname.
+        """
+        node = self._find(hostname, create=True)
+        endpoints = sorted(e.strip() for e in endpoints)
+        node.claims[source] = (generation, endpoints)
+
+        conflicts = []
+        for other, (other_generation, other_endpoints) in list(node.claims.items()):
+            if other_generation < generation:
+                del node.claims[other]
+            elif other != source and other_endpoints != endpoints:
+                conflicts.append(other)
+        return sorted(conflicts)
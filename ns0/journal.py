@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Write-ahead journal of provider operations.
+
+Every planned Record set operation is appended to the journal before it is
+sent to the provider, and marked done afterwards. Appends are buffered and
+written with a single fsync per commit() (group commit). After a crash,
+operations that were planned but never marked done are replayed, and the
+published state of every hostname is rebuilt without asking the providers.
+"""
+import json
+import os
+
+from logzero import logger
+
+
+def _decode(op):
+    # JSON turns (type, content) tuples into lists
+    for key in ("create", "delete", "values"):
+        if key in op:
+            op[key] = [tuple(value) for value in op[key]]
+    return op
+
+
+class Journal:
+    """
+    Append-only journal file made of JSON lines:
+        {"type": "state", "hostname": ..., "record": {...}}  published state
+        {"type": "plan", "seq": 1, "op": {...}}               planned operation
+        {"type": "done", "seq": 1, "ok": true}                finished operation
+    'state' lines are only written by compact(), which rewrites the journal
+    as the published state plus the operations still pending.
+    """
+
+    def __init__(self, path, compact_after=1000):
+        self.path = path
+        self.compact_after = compact_after
+        self.state = {}
+        self._pending = {}
+        self._buffer = []
+        self._seq = 0
+        self._done = 0
+
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, "a")
+
+    def _load(self):
+        # Bytes read, and bytes up to the end of the last complete entry
+        size = complete = 0
+        with open(self.path, "rb") as stream:
+            for line in stream:
+                size += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn write at the end of the journal, the operation
+                    # was never executed
+                    logger.warning("Ignoring corrupt journal entry in %s", self.path)
+                    continue
+                complete = size
+
+                if entry["type"] == "state":
+                    self.state[entry["hostname"]] = _decode(entry["record"])
+                elif entry["type"] == "plan":
+                    self._seq = max(self._seq, entry["seq"])
+                    self._pending[entry["seq"]] = _decode(entry["op"])
+                elif entry["type"] == "done":
+                    op = self._pending.pop(entry["seq"], None)
+                    if op is not None and entry.get("ok"):
+                        self._apply(op)
+                    self._done += 1
+
+        if complete < size:
+            # Cut off the torn write, or the next entry would be appended to it
+            os.truncate(self.path, complete)
+        elif size and not line.endswith(b"\n"):
+            # Only the newline of the last entry is missing
+            with open(self.path, "ab") as stream:
+                stream.write(b"\n")
+                stream.flush()
+                os.fsync(stream.fileno())
+
+    def _apply(self, op):
+        if op["action"] == "delete":
+            self.state.pop(op["hostname"], None)
+        else:
+            self.state[op["hostname"]] = {
+                key: op[key]
+                for key in ("provider", "values", "endpoints", "sources", "ttl")
+                if key in op
+            }
+
+    def _append(self, entry):
+        self._buffer.append(json.dumps(entry, default=str) + "\n")
+
+    def pending(self):
+        """Return planned operations that were never marked done, in order"""
+        return [dict(self._pending[seq], seq=seq) for seq in sorted(self._pending)]
+
+    def plan(self, op):
+        """Journal a planned operation. Returns its sequence number."""
+        self._seq += 1
+        self._pending[self._seq] = op
+        self._append({"type": "plan", "seq": self._seq, "op": op})
+        return self._seq
+
+    def done(self, seq, ok=True):
+        """Mark a planned operation as finished"""
+        op = self._pending.pop(seq, None)
+        if op is None:
+            return
+        if ok:
+            self._apply(op)
+        self._done += 1
+        self._append({"type": "done", "seq": seq, "ok": ok})
+
+    def _flush(self):
+        if self._buffer:
+            self._file.write("".join(self._buffer))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._buffer = []
+
+    def commit(self):
+        """Write and fsync all buffered entries at once"""
+        self._flush()
+        if self._done >= self.compact_after:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the journal as published state plus pending operations"""
+        # The rewritten journal supersedes anything still buffered
+        self._buffer = []
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as stream:
+            for hostname, record in self.state.items():
+                stream.write(
+                    json.dumps(
+                        {"type": "state", "hostname": hostname, "record": record},
+                        default=str,
+                    )
+                    + "\n"
+                )
+            for seq in sorted(self._pending):
+                stream.write(
+                    json.dumps(
+                        {"type": "plan", "seq": seq, "op": self._pending[seq]},
+                        default=str,
+                    )
+                    + "\n"
+                )
+            stream.flush()
+            os.fsync(stream.fileno())
+
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._fsync_dir()
+        self._file = open(self.path, "a")
+        self._done = 0
+        logger.debug(
+            "Compacted journal %s: %s records, %s pending operations",
+            self.path,
+            len(self.state),
+            len(self._pending),
+        )
+
+    def _fsync_dir(self):
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self._flush()
+        self._file.close()
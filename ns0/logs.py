@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Non-blocking logging pipeline for ns0.
+
+Log records are put on an in-memory queue by the calling thread, and only
+formatted and written by a background listener thread. Messages use lazy
+%-style arguments, so nothing is formatted for records that are discarded.
+Repeated warnings are sampled, and records can be written as JSON lines.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+import logzero
+from logzero import logger
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread."""
+
+    def __init__(self, queue, targets):
+        super(_QueueHandler, self).__init__(queue)
+        # The handlers the listener writes to, see restore_logging()
+        self.targets = targets
+
+    def prepare(self, record):
+        # The stock implementation formats the message in the calling thread.
+        # Records never leave the process here, so hand them over untouched.
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate-limit repeated log messages.
+
+    Records at `level` or above are grouped by level and message template (the
+    unformatted msg, e.g. "Record %s expired. TTL: %s. Delta: %s"). Errors are
+    grouped by their arguments too, so errors about different things all get
+    through. Per group, at most `burst` records pass every `interval` seconds.
+    Records with a traceback, or logged with extra={"sample": False}, always
+    pass. When a window with dropped records closes, a copy of the last
+    dropped record is passed to `emit`, reporting how many were dropped.
+    """
+
+    def __init__(self, interval=60, burst=5, level=logging.WARNING, emit=None):
+        super(SamplingFilter, self).__init__()
+        self.interval = interval
+        self.burst = burst
+        self.level = level
+        self.emit = emit
+        # key -> (start, count, suppressed, last suppressed record)
+        self._windows = {}
+        self._swept = time.monotonic()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        now = time.monotonic()
+        if now - self._swept >= min(self.interval, 1):
+            self.flush(now)
+
+        if (
+            record.levelno < self.level
+            or record.exc_info
+            or not getattr(record, "sample", True)
+        ):
+            return True
+
+        key = (record.levelno, record.msg)
+        if record.levelno >= logging.ERROR:
+            key += (repr(record.args),)
+        with self._lock:
+            start, count, suppressed, last = self._windows.get(key, (now, 0, 0, None))
+            if now - start >= self.interval:
+                self._report(suppressed, last)
+                start, count, suppressed, last = now, 0, 0, None
+
+            if count < self.burst:
+                self._windows[key] = (start, count + 1, suppressed, last)
+                return True
+
+            self._windows[key] = (start, count, suppressed + 1, record)
+            return False
+
+    def flush(self, now=None):
+        """
+        Report the dropped records of the windows that have closed by `now`,
+        or of all windows if `now` is None.
+        """
+        with self._lock:
+            self._swept = time.monotonic()
+            for key, (start, _, suppressed, last) in list(self._windows.items()):
+                if now is None or now - start >= self.interval:
+                    del self._windows[key]
+                    self._report(suppressed, last)
+
+    def _report(self, suppressed, last):
+        if not suppressed or self.emit is None:
+            return
+        summary = logging.makeLogRecord(last.__dict__)
+        summary.suppressed = suppressed
+        summary.msg = "{} ({} similar messages suppressed)".format(
+            last.msg, suppressed
+        )
+        self.emit(summary)
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as single-line JSON objects."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "suppressed", None):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    """QueueListener that hands logging back to the original handlers on stop()"""
+
+    def stop(self):
+        for handler in logger.handlers:
+            for log_filter in handler.filters:
+                if isinstance(log_filter, SamplingFilter):
+                    log_filter.flush()
+        # Records logged from here on are written directly, the ones still
+        # queued are written by the listener before it exits
+        restore_logging()
+        super(_QueueListener, self).stop()
+
+
+def restore_logging():
+    """Replace the queue handler of the logger by the handlers it forwards to."""
+    for handler in list(logger.handlers):
+        if isinstance(handler, _QueueHandler):
+            logger.removeHandler(handler)
+            for target in handler.targets:
+                logger.addHandler(target)
+
+
+def setup_worker_logging(level=logging.INFO, json_output=False):
+    """
+    Configure logging of a spawned worker process, e.g. a provider worker,
+    like in ns0 itself. Workers write their records directly.
+    """
+    logzero.loglevel(level)
+    if json_output:
+        for handler in logger.handlers:
+            handler.setFormatter(JsonFormatter())
+
+
+def setup_logging(json_output=False, sample_interval=60, sample_burst=5):
+    """
+    Route the logzero logger through a queue, so log calls never block on I/O.
+    The handlers configured on the logger are moved to a QueueListener thread.
+    Returns the started listener, whose stop() flushes pending records and
+    restores the original handlers.
+    """
+    handlers = [h for h in logger.handlers if not isinstance(h, _QueueHandler)]
+    if len(handlers) != len(logger.handlers):
+        # Already set up
+        return None
+
+    if json_output:
+        for handler in handlers:
+            handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue, handlers)
+    # Reports of dropped records are queued directly, bypassing the filter
+    queue_handler.addFilter(
+        SamplingFilter(sample_interval, sample_burst, emit=queue_handler.enqueue)
+    )
+
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+
+    listener = _QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Negative cache of hostnames, zones and providers ns0 can't publish to.
+
+Failures that won't go away by themselves are remembered with a reason
+code for a TTL of their own, and short-circuit further attempts:
+    * no_zone (hostname): the hostname has no registered domain
+    * no_ns (zone): the NS lookup of the zone failed
+    * no_provider (zone): no Lexicon provider matches the zone's nameservers
+    * no_auth (provider): Lexicon has no auth token for the provider
+Changed labels bypass the cache on their own (a new hostname, or a provider
+label that makes guessing unnecessary). Entries of providers whose
+configuration changes are dropped by NS0.reconfigure().
+"""
+import time
+
+from logzero import logger
+
+DEFAULT_TTLS = {"no_zone": 3600, "no_ns": 300, "no_provider": 3600, "no_auth": 3600}
+
+
+class NegativeCache:
+    """
+    Known-bad keys of the scopes 'hostname', 'zone' and 'provider'.
+    `ttls` maps reason codes to seconds.
+    """
+
+    def __init__(self, ttls=None):
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        # (scope, key) -> entry dict
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, scope, key, reason, detail=""):
+        """Remember a failure. It is logged once, not on every attempt."""
+        now = time.monotonic()
+        self._entries[(scope, key)] = {
+            "scope": scope,
+            "key": key,
+            "reason": reason,
+            "detail": detail,
+            "added": now,
+            "expires": now + self.ttls.get(reason, DEFAULT_TTLS["no_ns"]),
+            "hits": 0,
+        }
+        logger.warning(
+            "✗ Skipping %s %s for %ss: %s %s",
+            scope,
+            key,
+            self.ttls.get(reason, DEFAULT_TTLS["no_ns"]),
+            reason,
+            detail,
+            # Logged once per failure already
+            extra={"sample": False},
+        )
+
+    def get(self, scope, key):
+        """Return the reason code of a cached failure, or None"""
+        entry = self._entries.get((scope, key))
+        if entry is None:
+            return None
+        if time.monotonic() >= entry["expires"]:
+            self._entries.pop((scope, key), None)
+            logger.debug("Retrying %s %s after %s", scope, key, entry["reason"])
+            return None
+        entry["hits"] += 1
+        return entry["reason"]
+
+    def invalidate(self, scope=None, key=None):
+        """Drop the entries of a scope, of a single key, or all of them"""
+        for entry_scope, entry_key in list(self._entries):
+            if scope in (None, entry_scope) and key in (None, entry_key):
+                self._entries.pop((entry_scope, entry_key), None)
+
+    def dump(self):
+        """Return all live entries, with seconds until they expire"""
+        now = time.monotonic()
+        return [
+            {
+                "scope": entry["scope"],
+                "key": entry["key"],
+                "reason": entry["reason"],
+                "detail": entry["detail"],
+                "expires_in": round(entry["expires"] - now, 1),
+                "hits": entry["hits"],
+            }
+            for entry in sorted(
+                self._entries.values(), key=lambda entry: entry["added"]
+            )
+            if entry["expires"] > now
+        ]
@@ -1,15 +1,30 @@
 import datetime
 import logging
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import dns.exception
 import dns.resolver
 import logzero
 import tldextract
-from config import ConfigResolver, DictConfigSource
+from config import ConfigDirWatcher, ConfigResolver, DictConfigSource
+from health import HealthProber
+from index import HostnameIndex
+from journal import Journal
 from lexicon import discovery
+from logs import setup_logging
 from logzero import logger
+from negative import DEFAULT_TTLS, NegativeCache
+from profiling import tracer
 from providers.docker import Docker
-from providers.lexicon import LexiconClient
+from providers.file import FileSource
+from providers.lexicon import auth_token
+from store import RecordStore
+from supervisor import ProviderSupervisor
+from workqueue import DEFAULT_PRIORITIES, OperationQueue
 
 # We respect Lexicons Config here
 TLDEXTRACT_CACHE_FILE_DEFAULT = os.path.join("~", ".lexicon_tld_set")
@@ -38,7 +53,8 @@ class NS0:
     - DDNS: if configured, ns0 will keep its current external IP adress in Sync with a
     """
 
-    records = {
+    # Records ns0 publishes by itself
+    system_records = {
         "here.ns0.co": {
             "endpoints": ["local"],
             "sources": [{"name": "system", "type": "ns0", "id": "1"}],
@@ -56,20 +72,49 @@ class NS0:
     default_config = {
         "ttl": 10,
         "update_interval": 10,
+        "provider_workers": 2,
+        "provider_timeout": 30,
+        "provider_max_calls": 50,
+        "breaker_threshold": 3,
+        "breaker_reset": 60,
+        "log_format": "text",
+        "log_sample_interval": 60,
+        "log_sample_burst": 5,
+        "journal_compact": 1000,
+        "health_concurrency": 100,
+        "health_interval": 10,
+        "health_timeout": 2,
+        "queue_priority": DEFAULT_PRIORITIES,
+        "bootstrap_workers": 16,
+        "profile_cycles": 0,
+        "profile_dir": os.path.join(tempfile.gettempdir(), "ns0-profile"),
+        "profile_sample_interval": 0.005,
+        "negative_ttl": DEFAULT_TTLS,
+        "provider_cache_ttl": 3600,
     }
 
-    def __init__(self):
+    def __init__(self, config_dir=None, sync=True, docker=None, supervisor=None):
         logger.info("Initalizing ns0 ...")
 
+        # Configuration files rank between environment and defaults
         self.config = ConfigResolver()
-        self.config.with_env().with_dict(self.default_config)
+        self.config.with_env()
+        self.config_watcher = None
+        if config_dir:
+            self.config_watcher = ConfigDirWatcher(self.config, config_dir)
+        self.config.with_dict(self.default_config)
+
+        # Hand log records to a background thread from here on
+        self.log_listener = setup_logging(
+            json_output=self.config.resolve("ns0:log_format") == "json",
+            sample_interval=int(self.config.resolve("ns0:log_sample_interval")),
+            sample_burst=int(self.config.resolve("ns0:log_sample_burst")),
+        )
 
         # Guess available Endpoints
         # This includes Endpoints defined in the configuration
-        endpoints = self.guessEndpoints()
-        self.config.add_config_source(DictConfigSource(endpoints))
-
-        print(self.config.resolve("ns0:endpoints"))
+        self._endpoint_source = None
+        self.setEndpoints(self.guessEndpoints())
 
         if self.config:
             logger.info("Loaded initial Configuration")
@@ -78,42 +123,307 @@ class NS0:
 
         logger.info("Available Endpoints:")
 
-        for endpoint in self.config.resolve("ns0:endpoints"):
-            logger.info(
-                "{}:\t{}".format(
-                    endpoint, self.config.resolve("ns0:endpoints:{}".format(endpoint))
+        for endpoint, interfaces in self.config.resolve("ns0:endpoints").items():
+            logger.info("%s:\t%s", endpoint, interfaces)
+
+        # Set once the initial sync has finished, see bootstrap()
+        self.ready = threading.Event()
+        self._tldextract = None
+        # Zones guessed so far, to group indexed hostnames by zone
+        self.zones = set()
+        # Lexicon providers guessed for a zone: zone -> (providers, expires)
+        self.zone_providers = {}
+        # Hostnames, zones and providers known to fail, see negative.py.
+        # resolve() skips a TTL of 0, which disables caching of its reason.
+        ttls = self.config.scoped("ns0:negative_ttl")
+        self.negative = NegativeCache(
+            {reason: int(ttls.get(reason) or 0) for reason in DEFAULT_TTLS}
+        )
+
+        # Running Config: copy-on-write store, safe to read from any thread
+        self.records = RecordStore(self.system_records)
+
+        # Reversed-label index of all known hostnames, kept beside self.records
+        self.index = HostnameIndex()
+        for hostname, record in self.records.items():
+            self.index.add(hostname, record)
+        self.generation = 0
+
+        self.docker = docker or Docker()
+        # Sources of Records, merged on every update
+        self.sources = [self.docker]
+        if self.config.resolve("ns0:records_dir"):
+            self.sources.append(
+                FileSource(
+                    self.config.resolve("ns0:records_dir"),
+                    endpoints=lambda: self.config.resolve("ns0:endpoints"),
                 )
             )
+        # Records and last seen sequence number of every source
+        self.source_records = {}
+        self.source_seqs = {}
+        self.supervisor = supervisor or ProviderSupervisor(self.config)
+        self.prober = HealthProber(
+            int(self.config.resolve("ns0:health_concurrency")),
+            int(self.config.resolve("ns0:health_interval")),
+            int(self.config.resolve("ns0:health_timeout")),
+        )
 
-        self.docker = Docker()
-        self.update()
+        # Pending provider operations, at most one per hostname
+        self.queue = OperationQueue(self.config.resolve("ns0:queue_priority"))
 
-    def update(self):
-        # Guess Endpoints
-        endpoints = self.guessEndpoints()
+        # Optional write-ahead journal of provider operations
+        self.journal = None
+        if self.config.resolve("ns0:journal_path"):
+            self.journal = Journal(
+                self.config.resolve("ns0:journal_path"),
+                int(self.config.resolve("ns0:journal_compact")),
+            )
+            self.replay()
+
+        if sync:
+            self.bootstrap()
+
+    def close(self):
+        """Stop provider workers, flush the journal and pending log records"""
+        if self.ready.is_set() and self.config.resolve("ns0:ready_file"):
+            try:
+                os.remove(self.config.resolve("ns0:ready_file"))
+            except OSError:
+                pass
+        for source in self.sources:
+            source.close()
+        self.supervisor.close()
+        self.prober.close()
+        if self.journal:
+            self.journal.close()
+        if self.config_watcher:
+            self.config_watcher.close()
+        if self.log_listener:
+            self.log_listener.stop()
+
+    def now(self):
+        """Current time of Record discovery and expiry"""
+        return datetime.datetime.now()
+
+    def bootstrap(self):
+        """
+        Initial sync of all Records, made for a large number of hostnames.
+        The zones and Lexicon providers of all hostnames are guessed in
+        parallel, then the Records of different zones are published
+        concurrently. Sets self.ready and writes the optional ns0:ready_file
+        once done, so orchestrators can wait for ns0 to be ready.
+        """
+        started = time.monotonic()
+        workers = int(self.config.resolve("ns0:bootstrap_workers"))
+        ready_file = self.config.resolve("ns0:ready_file")
+        if ready_file and os.path.exists(ready_file):
+            # Left behind by a previous run
+            os.remove(ready_file)
+
+        records = self.collectRecords()
+        hostnames = sorted({record["hostname"] for record in records.values()})
+        logger.info("Bootstrap: guessing zones of %s hostnames", len(hostnames))
+
+        # Load the suffix list once, before threads use it
+        self.guessDomain("ns0.co")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            zones = dict(zip(hostnames, executor.map(self.guessZone, hostnames)))
+            unlabelled = sorted(
+                {
+                    zones[record["hostname"]]
+                    for record in records.values()
+                    if not record.get("provider")
+                }
+            )
+            logger.info("Bootstrap: guessing providers of %s zones", len(unlabelled))
+            # Zones without a provider end up in the negative cache
+            list(executor.map(self._guessZoneProvider, unlabelled))
+
+        self.update(records)
+        logger.info(
+            "Bootstrap: syncing %s Records in %s zones",
+            len(self.queue),
+            len(set(zones.values())),
+        )
+        error = self.flush(workers)
+
+        self.ready.set()
+        if ready_file:
+            with open(ready_file, "w") as stream:
+                stream.write("{}\n".format(datetime.datetime.now().isoformat()))
+        logger.info(
+            "Bootstrap finished in %.1fs%s",
+            time.monotonic() - started,
+            ", with errors" if error else "",
+        )
+        return error
 
-        self.config.add_config_source(DictConfigSource(endpoints))
+    def update(self, records=None):
+        # Guess Endpoints
+        self.setEndpoints(self.guessEndpoints())
 
         # Get latest Records from sources
-        records = self.docker.getRecords()
+        if records is None:
+            records = self.collectRecords()
+
+        # Claims of sources on hostnames are renewed on every update
+        self.generation += 1
 
         # Update self.records
         updates = self.createRecords(records)
+
+        if self.config.resolve("ns0:health_metrics_file"):
+            self.prober.export(self.config.resolve("ns0:health_metrics_file"))
         return updates
 
+    def collectRecords(self):
+        """
+        Merge the Records of all sources. Only the changes since the previous
+        call are taken from each source, the rest is kept from earlier calls.
+        Records that disappear from a source expire like any other Record.
+        """
+        for source in self.sources:
+            with tracer.span("source", source=source.name):
+                change = source.changes(self.source_seqs.get(source.name))
+            records = self.source_records.setdefault(source.name, {})
+            if change.full:
+                records.clear()
+            records.update(change.records)
+            for key in change.removed:
+                records.pop(key, None)
+            if change.seq != self.source_seqs.get(source.name):
+                logger.debug(
+                    "Source %s at #%s: %s changed, %s removed",
+                    source.name,
+                    change.seq,
+                    len(change.records),
+                    len(change.removed),
+                )
+            self.source_seqs[source.name] = change.seq
+
+        merged = {}
+        for name, records in self.source_records.items():
+            for key, record in records.items():
+                merged["{}:{}".format(name, key)] = record
+        return merged
+
+    def replay(self):
+        """
+        Restore the Running Config from the journal and finish the
+        operations that were interrupted by a crash or restart.
+        Restored Records expire as usual if no source claims them again.
+        """
+        now = self.now()
+        with self.records.transaction() as txn:
+            for hostname, record in self.journal.state.items():
+                self.index.add(hostname, txn.set(hostname, dict(record, found=now)))
+
+        pending = self.journal.pending()
+        logger.info(
+            "Restored %s Records from journal, replaying %s operations",
+            len(self.journal.state),
+            len(pending),
+        )
+        return self.apply(pending)
+
+    def flush(self, workers=1):
+        """
+        Execute the queued operations in priority order.
+        Returns True if any operation failed.
+        """
+        if not self.queue:
+            return False
+        superseded = self.queue.superseded
+        error = self.apply(list(self.queue.drain()), workers)
+        if superseded:
+            logger.info("Skipped %s superseded operations", superseded)
+            self.queue.superseded = 0
+        return error
+
+    def setEndpoints(self, endpoints):
+        """Replace the previously guessed Endpoints in the configuration"""
+        endpoint_source = DictConfigSource(endpoints)
+        if self._endpoint_source is None:
+            self.config.add_config_source(endpoint_source)
+        else:
+            self.config.replace_config_source(self._endpoint_source, endpoint_source)
+        self._endpoint_source = endpoint_source
+
+    def reload(self):
+        """Pick up changed configuration files and re-evaluate affected Records"""
+        if self.config_watcher:
+            return self.reconfigure(self.config_watcher.reload())
+        return []
+
+    def reconfigure(self, changed_keys):
+        """
+        Re-evaluate only the Records depending on the given changed config keys.
+        - ns0:ttl updates the TTL of every expiring Record in place
+        - ns0:endpoints:<endpoint>:* re-syncs Records using that Endpoint
+        - ns0:<provider>:* re-syncs Records published at that provider
+        Returns the list of re-synced hostnames.
+        """
+        if not changed_keys:
+            return []
+
+        logger.info("Configuration changed: %s", ", ".join(sorted(changed_keys)))
+
+        if "ns0:ttl" in changed_keys:
+            ttl = self.config.resolve("ns0:ttl")
+            with self.records.transaction() as txn:
+                for hostname in list(txn):
+                    # A TTL of 0 marks Records that never expire
+                    if txn[hostname].get("ttl", 0) != 0:
+                        self.index.add(hostname, txn.update(hostname, ttl=ttl))
+
+        endpoints = set()
+        providers = set()
+        for key in changed_keys:
+            scope = key.split(":")
+            if len(scope) < 3:
+                continue
+            if scope[1] == "endpoints":
+                endpoints.add(scope[2])
+            else:
+                providers.add(scope[1])
+
+        # Give providers with a changed configuration another chance
+        for provider_name in providers:
+            self.negative.invalidate("provider", provider_name)
+
+        resync = {}
+        force = set()
+        records = self.records.snapshot()
+        for hostname in records:
+            record = records[hostname]
+            if record.get("provider") in providers:
+                # Publish the whole Record set again with the new provider
+                # options. Lexicon creates are idempotent.
+                resync[hostname] = dict(record, hostname=hostname)
+                force.add(hostname)
+            elif endpoints.intersection(record["endpoints"]):
+                resync[hostname] = dict(record, hostname=hostname)
+
+        self.createRecords(resync, force)
+
+        return list(resync)
+
     def clean(self):
         """Garbage Collection for expired Records"""
         expired = []
 
-        for record in self.records:
-            now = datetime.datetime.now()
+        # Work on a snapshot, Records may be deleted while we iterate
+        records = self.records.snapshot()
+        for record in records:
+            now = self.now()
 
             # Get Default TTL
             ttl = self.config.resolve("ns0:ttl")
 
             # Check if the record has a specific TTL set
-            if "ttl" in self.records[record]:
-                ttl = self.records[record]["ttl"]
+            if "ttl" in records[record]:
+                ttl = records[record]["ttl"]
 
             # Check difference between update_interval and ttl
             # If update_interval is close to ttl (or higher), ns0 gets locked
@@ -133,11 +443,11 @@ class NS0:
                 treshhold = treshhold + (update_interval - ttl)
 
             # If TTL is 0, we don't expire the record
-            delta = int((now - self.records[record]["found"]).total_seconds())
+            delta = int((now - records[record]["found"]).total_seconds())
             if ttl != 0 and delta >= (ttl + treshhold):
                 # Record is over its TTL
                 logger.warning(
-                    "Record {} expired. TTL: {}. Delta: {}".format(record, ttl, delta)
+                    "Record %s expired. TTL: %s. Delta: %s", record, ttl, delta
                 )
                 expired.append(record)
 
@@ -145,227 +455,410 @@ class NS0:
         return deletion
 
     def deleteRecords(self, records):
-        error = False
-        for record in records:
+        """Queue the deletion of the Record sets of the given hostnames"""
+        for hostname in records:
             # When looping over `records` we're getting the dict key
-            # aka `record_name`
-            record_name = record
-
-            # Set Hostname
-            # Set Endpoints
-            # Set Sources
-            # Set Found
-            # Set TTL
-            hostname = record_name
-            guess = self.guessDomain(hostname)
-            domain = "{}.{}".format(guess.domain, guess.suffix)
-            name = guess.subdomain
-
-            provider_name = ""
-            if "provider" in self.records[record_name]:
-                provider_name = self.records[record_name]["provider"]
-            else:
-                # Guess DNS provider from Hostname
-                provider_name = self.guessProvider(hostname)[0]
-            endpoints = self.records[record_name]["endpoints"]
+            # aka `hostname`
+            record = self.records.get(hostname)
+            if record is None:
+                continue
+
+            # Without a provider nothing was published, the delete is a no-op
+            provider_name = (
+                record.get("provider") or (self.guessProvider(hostname) or [None])[0]
+            )
 
             # hostname should be deleted
             # DELETE
-            # We're invoking Lexicon to delete a Record for each endpoint
-            # our Record specifies
-            for endpoint in endpoints:
-                # Now we involve Lexicon
-                # Lexicon works in an idempotent way already - it checks
-                # if the record already exists before creating it
-                # - at least this behaviour is required by the providers
-                # That's why we can simply 'create' here, without further checks
-                # provider_name, action, domain, name, type, content
-                lex = LexiconClient(
-                    provider_name,  # provider_name
-                    "delete",  # action
-                    domain,  # domain
-                    name,  # name
-                    "A",  # type
-                    self.endpoints[endpoint],  # content (e.g. endpoint IP)
-                )
-
-                try:
-                    lex.execute()
-                    logger.debug(
-                        "{}: Record {} deleted from Running Config".format(
-                            provider_name, record
-                        )
-                    )
-
-                    del self.records[record]
-                    logger.debug(
-                        "{}: Record {} deleted from Running Config".format(
-                            provider_name, record
-                        )
-                    )
-                except Exception as e:
-                    error = True
-                    logger.exception(
-                        "{}: failed to delete Record {} with Lexicon: {}".format(
-                            provider_name, record, e
-                        )
-                    )
-
-        return error or True
+            # We're deleting every value we've published for this hostname
+            # in a single Record set update
+            self.queue.push(
+                {
+                    "action": "delete",
+                    "hostname": hostname,
+                    "provider": provider_name,
+                    "create": [],
+                    "delete": list(record.get("values", [])),
+                }
+            )
 
-    def createRecords(self, records):
-        error = False
+        return True
+
+    def createRecords(self, records, force=()):
+        """
+        Queue the creation or update of Records at their providers.
+        All A/AAAA values of a hostname, across its Endpoints, form a Record set
+        that is published as a single batch. For hostnames that are already
+        known, only the difference to the published Record set is sent, except
+        for the hostnames in `force`, whose whole Record set is sent again.
+        Operations are executed by flush().
+        """
         # TARGET DICT
         # "here.ns0.co": {
         #     "endpoints": ["local"],
         #     "sources": [{"name": "system", "type": "ns0", "id": "1"}],
         #     "found": datetime.datetime.now(),
         #     "ttl": 0,
+        #     "provider": "cloudflare",
+        #     "values": [("A", "1.2.3.4"), ("AAAA", "::1")],
         # },
-        if records:
-            for record in records:
+        if not records:
+            return False
 
+        # Changes to the Running Config become visible at once, when the
+        # transaction is published
+        with self.records.transaction() as txn:
+            for record_name in records:
                 # When looping over `records` we're getting the dict key
                 # aka `record_name`
-                record_name = record
-
-                # Set Hostname
-                # Set Endpoints
-                # Set Sources
-                # Set Found
-                # Set TTL
                 hostname = records[record_name]["hostname"]
-                guess = self.guessDomain(hostname)
-                domain = "{}.{}".format(guess.domain, guess.suffix)
-                name = guess.subdomain
-                provider_name = ""
-                if "provider" in records[record_name]:
-                    provider_name = records[record_name]["provider"]
-                else:
-                    # Guess DNS provider from Hostname
-                    provider_name = self.guessProvider(hostname)[0]
-
                 endpoints = records[record_name]["endpoints"]
                 sources = records[record_name]["sources"]
-                found = datetime.datetime.now()
-                ttl = self.config.resolve("ns0:ttl")
+                found = self.now()
+
+                if hostname not in txn:
+                    # Before the claims below add the hostname to the index
+                    matched, _ = self.index.match(hostname)
+                    if matched:
+                        logger.info("%s overlaps the wildcard %s", hostname, matched)
+
+                # Check if the sources of this record agree with other sources
+                # on the Endpoints of this hostname
+                conflicts = []
+                for source in sources:
+                    conflicts += self.index.claim(
+                        hostname,
+                        "{}:{}".format(source["type"], source["id"]),
+                        endpoints,
+                        self.generation,
+                    )
+                if conflicts and hostname in txn:
+                    # First come, first served: keep the published Endpoints
+                    # instead of flapping between the claims
+                    logger.warning(
+                        "Conflicting Endpoints for %s: %s wants %s, %s disagree. "
+                        "Keeping %s",
+                        hostname,
+                        ", ".join(source["id"] for source in sources),
+                        endpoints,
+                        ", ".join(sorted(set(conflicts))),
+                        txn[hostname]["endpoints"],
+                    )
+                    endpoints = txn[hostname]["endpoints"]
+
+                values = self.resolveValues(endpoints)
+                healthcheck = records[record_name].get("healthcheck")
+                if healthcheck:
+                    values = self.healthyValues(hostname, healthcheck, values)
 
                 # Check if hostname is already in records
-                if hostname in self.records:
+                if hostname in txn:
                     # hostname already exists in records
                     # UPDATE
-                    # Check Endpoints
-                    running_config_endpoints = len(self.records[hostname]["endpoints"])
-                    incoming_config_endpoints = len(endpoints)
-
-                    if running_config_endpoints != incoming_config_endpoints:
-                        # Old and new Endpoints do not match
-                        # Let's delete this record and re-scan
-                        try:
-                            logger.info(
-                                "✓ Detected changes in Record Endpoints. \
-                                    Deleting Record {}".format(
-                                    hostname
-                                )
-                            )
-                            self.deleteRecords([hostname])
-
-                            # TODO: Trigger instant Re-Scan here
-                        except Exception as e:
-                            logger.exception(
-                                "✗ {}: failed to delete Record {} \
-                                    with Lexicon: {}".format(
-                                    provider_name, e
-                                )
-                            )
-                        continue
+                    running = txn[hostname]
+                    provider_name = (
+                        records[record_name].get("provider")
+                        or running.get("provider")
+                        # Records ns0 publishes by itself have no provider yet
+                        or (self.guessProvider(hostname) or [None])[0]
+                    )
 
                     # Check sources
                     # Loop over existing and new sources,
                     # check if any of the id's match
                     # If nothing matches, add the new source to the array
+                    running_sources = list(running["sources"])
                     for source in sources:
                         invalid = False
-                        for e_source in self.records[hostname]["sources"]:
+                        for e_source in running_sources:
                             if (
                                 source["id"] == e_source["id"]
                                 and source["type"] == e_source["type"]
                             ):
                                 invalid = True
                         if not invalid:
-                            self.records[hostname]["sources"].append(source)
+                            running_sources.append(source)
 
                     # Set found to current date so the record doesn't expire
-                    self.records[hostname]["found"] = found
+                    record = txn.update(
+                        hostname,
+                        sources=running_sources,
+                        found=found,
+                        endpoints=endpoints,
+                        healthcheck=healthcheck,
+                    )
+                    self.index.add(hostname, record)
                 else:
                     # hostname doesn't exist in records
                     # CREATE
-                    self.records[hostname] = {
+                    provider_name = records[record_name].get("provider")
+                    if not provider_name:
+                        # Guess DNS provider from Hostname
+                        provider_name = (self.guessProvider(hostname) or [None])[0]
+
+                    record = txn.set(
+                        hostname,
+                        {
+                            "endpoints": endpoints,
+                            "sources": sources,
+                            "found": found,
+                            "ttl": self.config.resolve("ns0:ttl"),
+                            "provider": provider_name,
+                            "values": [],
+                            "healthcheck": healthcheck,
+                        },
+                    )
+                    self.index.add(hostname, record)
+
+                # Only talk to the provider if the Record set changed
+                published = txn[hostname].get("values", ())
+                forced = hostname in force
+                if values == published and hostname not in self.queue and not forced:
+                    continue
+
+                # Don't plan operations that are known to fail
+                if not provider_name or self.negative.get("provider", provider_name):
+                    continue
+
+                if values and published and values != published:
+                    logger.info(
+                        "✓ Detected changes in Record Endpoints. Updating Record %s",
+                        hostname,
+                    )
+
+                # Supersedes a pending operation of this hostname. Both were
+                # planned against the published values, so a create undoing
+                # a pending delete becomes a no-op.
+                self.queue.push(
+                    {
+                        "action": "update",
+                        "hostname": hostname,
+                        "provider": provider_name,
+                        "create": [
+                            value
+                            for value in values
+                            if forced or value not in published
+                        ],
+                        "delete": [value for value in published if value not in values],
+                        "values": values,
                         "endpoints": endpoints,
-                        "sources": sources,
-                        "found": found,
-                        "ttl": ttl,
+                        "sources": [
+                            dict(source) for source in txn[hostname]["sources"]
+                        ],
+                        "ttl": txn[hostname]["ttl"],
                     }
+                )
 
-                    # We're invoking Lexicon to create a Record for each endpoint
-                    # our Record specifies
-                    for endpoint in endpoints:
-                        for interface in self.config.resolve(
-                            "ns0:endpoints:{}".format(endpoint)
-                        ):
-                            # Now we involve Lexicon
-                            # Lexicon works in an idempotent way already - it checks
-                            # if the record already exists before creating it
-                            # - at least this behaviour is required by the providers
-                            # That's why we can simply 'create' here, without further
-                            # checks
-                            type = "A"
-                            if (
-                                self.config.resolve(
-                                    "ns0:endpoints:{}:{}".format(endpoint, interface)
-                                )
-                                == "ipv6"
-                            ):
-                                type = "AAAA"
-                            lex = LexiconClient(
-                                provider_name,  # provider_name
-                                "create",  # action
-                                domain,  # domain
-                                name,  # name
-                                type,  # type
-                                self.config.resolve(
-                                    "ns0:endpoints:{}:{}".format(endpoint, interface)
-                                ),  # content (e.g. endpoint IP)
-                            )
-
-                        try:
-                            create_result = lex.execute()
-
-                            if create_result:
-                                logger.debug(
-                                    "{}: Record {} added to Running Config".format(
-                                        provider_name, hostname
-                                    )
-                                )
-                        except Exception as e:
-                            error = True
-                            logger.exception(
-                                "{}: failed to create Record {} with Lexicon: {}".format(  # noqa: E501
-                                    provider_name, hostname, e
-                                )
-                            )
-
-            return error or True
+        return True
+
+    def apply(self, ops, workers=1):
+        """
+        Execute planned Record set operations and update the Running Config.
+        With a journal, all operations are made durable with a single fsync
+        before the first provider call, and marked done after execution.
+        Operations carrying a `seq` were journaled already (replay).
+        The operations of different providers are synced concurrently, so a
+        provider that is down doesn't hold back the others. With more than
+        one worker, the zones of the operations are synced concurrently, and
+        the operations of each zone in order. The results
+        are published to the Running Config in a single transaction.
+        Returns True if any operation failed.
+        """
+        if self.journal:
+            for op in ops:
+                if "seq" not in op:
+                    op["seq"] = self.journal.plan(op)
+            self.journal.commit()
+
+        if workers > 1:
+            results = self._syncZones(ops, workers)
+        else:
+            results = self._syncProviders(ops)
+
+        results = list(results)
+        error = not all(ok for _, ok in results)
+
+        # The Running Config and the journal are only updated from this thread
+        with self.records.transaction() as txn:
+            for op, ok in results:
+                if ok:
+                    self.applied(txn, op)
+        if self.journal:
+            for op, ok in results:
+                self.journal.done(op["seq"], ok)
+
+        if self.journal:
+            self.journal.commit()
+        return error
+
+    def _sync(self, op):
+        return op, self.syncRecord(
+            op["provider"], op["hostname"], op["create"], op["delete"]
+        )
+
+    def _syncProviders(self, ops):
+        """Yield (op, ok) for the operations, syncing providers concurrently"""
+        providers = {}
+        for op in ops:
+            providers.setdefault(op["provider"], []).append(op)
+        if len(providers) < 2:
+            yield from map(self._sync, ops)
+            return
+
+        def sync(provider_name):
+            return [self._sync(op) for op in providers[provider_name]]
+
+        with ThreadPoolExecutor(max_workers=len(providers)) as executor:
+            for results in executor.map(sync, providers):
+                yield from results
+
+    def _syncZones(self, ops, workers):
+        """Yield (op, ok) for the operations, syncing zones concurrently"""
+        zone_of = {
+            hostname: zone
+            for zone, hostnames in self.index.group(self.zones).items()
+            for hostname in hostnames
+        }
+        zones = {}
+        for op in ops:
+            zone = zone_of.get(op["hostname"]) or self.guessZone(op["hostname"])
+            zones.setdefault(zone, []).append(op)
+
+        def sync(zone):
+            return zone, [self._sync(op) for op in zones[zone]]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(sync, zone) for zone in zones]
+            for count, future in enumerate(as_completed(futures), 1):
+                zone, results = future.result()
+                logger.info("Synced zone %s (%s/%s)", zone, count, len(zones))
+                yield from results
+
+    def applied(self, txn, op):
+        """Reflect a successfully executed operation in a Running Config transaction"""
+        hostname = op["hostname"]
+        if op["action"] == "delete":
+            if txn.delete(hostname) is not None:
+                self.index.remove(hostname)
+            logger.debug(
+                "%s: Record %s deleted from Running Config", op["provider"], hostname
+            )
+            return
+
+        if hostname in txn:
+            record = txn.update(hostname, values=op["values"])
         else:
+            # Replayed operation of a Record ns0 hadn't seen yet
+            record = txn.set(
+                hostname,
+                {
+                    "endpoints": op["endpoints"],
+                    "sources": op["sources"],
+                    "found": self.now(),
+                    "ttl": op["ttl"],
+                    "provider": op["provider"],
+                    "values": op["values"],
+                },
+            )
+        self.index.add(hostname, record)
+        logger.debug("%s: Record %s added to Running Config", op["provider"], hostname)
+
+    def syncRecord(self, provider_name, hostname, create=None, delete=None):
+        """
+        Apply changes to the Record set of a hostname at its provider.
+        `create` and `delete` are lists of (type, content) values. New values
+        are created before stale ones are deleted, so the name keeps resolving.
+        Returns True on success.
+        """
+        if not create and not delete:
+            return True
+
+        if self.negative.get("provider", provider_name):
+            return False
+        if not self.hasAuthToken(provider_name):
+            self.negative.add("provider", provider_name, "no_auth", hostname)
             return False
 
-    def guessDomain(self, hostname):
-        extract = tldextract.TLDExtract(
-            cache_file=TLDEXTRACT_CACHE_FILE, include_psl_private_domains=True
+        guess = self.guessDomain(hostname)
+        domain = "{}.{}".format(guess.domain, guess.suffix)
+        name = guess.subdomain
+
+        changes = [("create", type, content) for (type, content) in create or []]
+        changes += [("delete", type, content) for (type, content) in delete or []]
+
+        try:
+            with tracer.span("lexicon", hostname=hostname, provider=provider_name):
+                return bool(
+                    self.supervisor.execute_rrset(provider_name, domain, name, changes)
+                )
+        except Exception as e:
+            logger.exception(
+                "%s: failed to update Record %s with Lexicon: %s",
+                provider_name,
+                hostname,
+                e,
+            )
+            return False
+
+    def hasAuthToken(self, provider_name):
+        options = self.config.scoped("ns0:{}".format(provider_name))
+        return bool(auth_token(provider_name, options))
+
+    def healthyValues(self, hostname, check, values):
+        """
+        Withhold the values whose address hasn't passed its healthcheck.
+        Probes run in the background, a value is published once its first
+        probe succeeded and withdrawn while it fails.
+        """
+        healthy = tuple(
+            value for value in values if self.prober.status(check, value[1])
         )
-        tld = extract(hostname)
+        if len(healthy) != len(values):
+            logger.debug(
+                "Withholding unhealthy values of %s: %s",
+                hostname,
+                [value for value in values if value not in healthy],
+            )
+        return healthy
+
+    def resolveValues(self, endpoints):
+        """
+        Return the sorted (type, content) Record values for the given Endpoints,
+        as a tuple like the values of stored Records
+        """
+        values = set()
+        for endpoint in endpoints:
+            interfaces = (
+                self.config.resolve("ns0:endpoints:{}".format(endpoint.strip())) or {}
+            )
+            for interface, address in interfaces.items():
+                if address:
+                    values.add(("AAAA" if interface == "ipv6" else "A", address))
+        return tuple(sorted(values))
+
+    def guessDomain(self, hostname):
+        if self._tldextract is None:
+            self._tldextract = tldextract.TLDExtract(
+                cache_file=TLDEXTRACT_CACHE_FILE, include_psl_private_domains=True
+            )
+        with tracer.span("tldextract", hostname=hostname):
+            tld = self._tldextract(hostname)
         return tld
 
+    def guessZone(self, hostname):
+        """Return the registered domain of a hostname, e.g. ns0.co"""
+        domain = self.guessDomain(hostname)
+        zone = "{}.{}".format(domain.domain, domain.suffix)
+        self.zones.add(zone)
+        return zone
+
+    def _guessZoneProvider(self, zone):
+        try:
+            return self.guessProvider(zone)
+        except Exception as e:
+            logger.warning("Can't guess the provider of %s: %s", zone, e)
+            return []
+
     def guessEndpoints(self):
         endpoints = {
             "private": {"ipv4": "127.0.0.1", "ipv6": "::1"},
@@ -403,12 +896,34 @@ class NS0:
         return {"endpoints": endpoints}
 
     def guessProvider(self, hostname):
+        """
+        Return the Lexicon providers matching the nameservers of the zone of
+        a hostname. Returns [] for hostnames and zones in the negative cache.
+        """
         domain = self.guessDomain(hostname)
+        if self.negative.get("hostname", hostname):
+            return []
+        if not domain.domain or not domain.suffix:
+            self.negative.add("hostname", hostname, "no_zone")
+            return []
+
         resolve = "{}.{}".format(domain.domain, domain.suffix)
-        nameservers = dns.resolver.query(resolve, "NS")
+        providers, expires = self.zone_providers.get(resolve, ([], 0))
+        if time.monotonic() < expires:
+            return providers
+        self.zone_providers.pop(resolve, None)
+        if self.negative.get("zone", resolve):
+            return []
+        try:
+            with tracer.span("dns", hostname=resolve):
+                nameservers = dns.resolver.query(resolve, "NS")
+        except dns.exception.DNSException as e:
+            self.negative.add("zone", resolve, "no_ns", type(e).__name__)
+            return []
 
         # 1 Get Lexicon Providers
-        lexicon_providers = discovery.find_providers()
+        with tracer.span("lexicon_discovery", hostname=resolve):
+            lexicon_providers = discovery.find_providers()
 
         valid_guesses = set([])
 
@@ -418,7 +933,18 @@ class NS0:
             nameserver = str(nameserver.target).strip()
             domain = self.guessDomain(str(nameserver).strip())
             extracted_provider = domain.domain
-            lexicon_provider = lexicon_providers[extracted_provider]
+            lexicon_provider = lexicon_providers.get(extracted_provider)
             if lexicon_provider:
                 valid_guesses.add(extracted_provider)
+        if not valid_guesses:
+            self.negative.add(
+                "zone",
+                resolve,
+                "no_provider",
+                ", ".join(str(nameserver.target) for nameserver in nameservers),
+            )
+            return []
+        # Zones move between providers, so guesses are only cached for a while
+        ttl = int(self.config.resolve("ns0:provider_cache_ttl") or 0)
+        self.zone_providers[resolve] = (list(valid_guesses), time.monotonic() + ttl)
         return list(valid_guesses)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracing and profiling of ns0 update cycles.
+
+The span tracer is always on. It keeps the most recent spans (name, tags,
+duration) in a ring buffer, e.g. one span per provider call tagged with
+hostname and provider:
+    $ with tracer.span("sync", hostname=hostname, provider=provider_name):
+    $     ...
+Recording a span costs two clock reads and a deque append.
+
+The cycle profiler is opt-in. Once requested, e.g. with SIGUSR1, it profiles
+the next N cycles with cProfile and a sampling profiler. For each cycle it
+writes to its output directory:
+    * cycle-<n>.prof: cProfile statistics, readable with pstats or snakeviz
+    * cycle-<n>.collapsed: sampled stacks, for flamegraph.pl or speedscope
+    * cycle-<n>.json: per-phase timings and span statistics
+"""
+import collections
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from logzero import logger
+
+Span = collections.namedtuple("Span", ["name", "tags", "start", "duration"])
+
+
+class Tracer:
+    """Ring buffer of the most recent spans"""
+
+    def __init__(self, size=10000):
+        self.spans = collections.deque(maxlen=size)
+
+    @contextmanager
+    def span(self, name, **tags):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append(Span(name, tags, start, time.perf_counter() - start))
+
+    def stats(self, since=0):
+        """
+        Aggregate the spans started after `since` (a perf_counter value) by
+        name: count, total and max duration, and the tags of the slowest span.
+        """
+        stats = {}
+        for span in list(self.spans):
+            if span.start < since:
+                continue
+            entry = stats.setdefault(
+                span.name, {"count": 0, "total": 0.0, "max": 0.0, "slowest": None}
+            )
+            entry["count"] += 1
+            entry["total"] += span.duration
+            if span.duration >= entry["max"]:
+                entry["max"] = span.duration
+                entry["slowest"] = span.tags
+        return stats
+
+
+tracer = Tracer()
+
+
+class StackSampler:
+    """
+    Sample the stack of one thread at a fixed interval and count the
+    collapsed stacks ("outer;inner;leaf").
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="ns0-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+                )
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, "w") as stream:
+            for stack, count in self.counts.most_common():
+                stream.write("{} {}\n".format(stack, count))
+
+
+class CycleProfiler:
+    """
+    Profile the next N update cycles on request. phase() times the phases
+    of every cycle, profiled or not.
+    """
+
+    def __init__(self, output_dir, sample_interval=0.005):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.remaining = 0
+        self.phases = {}
+        self._cycle = 0
+
+    def request(self, cycles):
+        """Profile the next `cycles` cycles. Safe to call from a signal handler."""
+        self.remaining = cycles
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            with tracer.span(name):
+                yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    @contextmanager
+    def cycle(self):
+        self._cycle += 1
+        self.phases = {}
+        if self.remaining <= 0:
+            yield
+            return
+
+        self.remaining -= 1
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, "cycle-{}".format(self._cycle))
+        started = time.perf_counter()
+        profile = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            sampler.stop()
+            duration = time.perf_counter() - started
+
+            profile.dump_stats(prefix + ".prof")
+            sampler.write(prefix + ".collapsed")
+            with open(prefix + ".json", "w") as stream:
+                json.dump(
+                    {
+                        "cycle": self._cycle,
+                        "duration": duration,
+                        "phases": self.phases,
+                        "spans": tracer.stats(since=started),
+                    },
+                    stream,
+                    indent=2,
+                    default=str,
+                )
+            logger.info(
+                "Profiled cycle %s in %.3fs (%s), written to %s.*",
+                self._cycle,
+                duration,
+                ", ".join(
+                    "{} {:.3f}s".format(name, seconds)
+                    for name, seconds in self.phases.items()
+                ),
+                prefix,
+            )
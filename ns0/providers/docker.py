@@ -1,16 +1,28 @@
 import docker
+from health import parse_check
+from providers.source import RecordSource
 
 
-class Docker:
-    """Docker"""
+class Docker(RecordSource):
+    """
+    Records from the labels of running Docker containers.
+    Containers are listed on every call, changes are computed from the
+    difference of the listings.
+    """
 
-    def __init__(self):
-        self.client = docker.from_env()
+    name = "docker"
+
+    def __init__(self, client=None):
+        super(Docker, self).__init__()
+        self.client = client or docker.from_env()
+
+    def snapshot(self):
+        return self.getRecords()
 
     def getRecords(self):
         """Function description."""
-        # Creating a Set here instead of a list to promote deduplication
-        records = []
+        # Records of all containers, keyed by container and record_name
+        records = {}
 
         for container in self.client.containers.list():
             container_labels = []
@@ -22,9 +34,6 @@ class Docker:
 
             # Container contains labels that are relevant for us
             if len(container_labels) > 0:
-                # Parse labels to Records
-                records = {}
-
                 # Example Labels:
                 # ns0.traefik.hostname=proxy.ns0.co
                 # ns0.traefik.endpoints=public
@@ -43,7 +52,8 @@ class Docker:
                     # Example Labels:
                     # traefik
                     # traefik
-                    record_name = label_as_list[0]
+                    # Namespaces of different containers don't collide
+                    record_name = "{}.{}".format(container.id, label_as_list[0])
 
                     # Remove first item (record_name) from list
                     #
@@ -68,6 +78,8 @@ class Docker:
                     value = container.labels[label]
                     if key == "endpoints":
                         value = value.split(",")
+                    elif key == "healthcheck":
+                        value = parse_check(value)
 
                     # If we haven't already parsed this frontend, create empty key
                     if record_name not in records:
@@ -94,4 +106,4 @@ class Docker:
                     if not invalid:
                         records[record_name]["sources"].append(source)
 
-                return records
+        return records
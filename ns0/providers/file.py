@@ -0,0 +1,132 @@
+import json
+import os
+
+import yaml
+from health import parse_check
+from logzero import logger
+from providers.source import ChangeSet, RecordSource
+from providers.zonefile import from_bind, from_ndjson
+from watch import DirectoryWatcher
+
+RECORD_FILE_PATTERN = r"\.(ya?ml|json|zone|ndjson)$"
+
+
+class FileSource(RecordSource):
+    """
+    Static Records from the YAML or JSON files of a directory.
+
+    Example file:
+        web.example.com:
+          endpoints: [public, zerotier]
+          provider: cloudflare
+          healthcheck: tcp:443
+    Zone files written by the zone tool are read too: BIND zone files
+    (*.zone) and NDJSON (*.ndjson). `endpoints` returns the ns0:endpoints
+    mapping, to find the Endpoints of BIND records without ns0 comment.
+    Only files reported by the DirectoryWatcher are parsed again, so a
+    cycle without changed files costs no I/O beyond the watcher itself.
+    A file that fails to parse keeps its last good Records.
+    """
+
+    def __init__(self, dir_path, pattern=RECORD_FILE_PATTERN, endpoints=None):
+        super(FileSource, self).__init__()
+        self.name = "file:{}".format(dir_path)
+        self.endpoints = endpoints or dict
+        self.watcher = DirectoryWatcher(dir_path, pattern)
+        # path -> {key: record}
+        self._files = {path: self._load(path) or {} for path in self.watcher.paths()}
+
+    def _load(self, path):
+        if path.endswith((".zone", ".ndjson")):
+            return self._load_zone(path)
+        try:
+            with open(path, "r") as stream:
+                if path.endswith(".json"):
+                    document = json.load(stream)
+                else:
+                    document = yaml.safe_load(stream)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            logger.error("Can't load Records of %s: %s", path, e)
+            return None
+
+        document = document or {}
+        if not isinstance(document, dict) or not all(
+            isinstance(options, dict) or options is None
+            for options in document.values()
+        ):
+            logger.error(
+                "Can't load Records of %s: expected a mapping of hostnames to "
+                "options",
+                path,
+            )
+            return None
+
+        records = {}
+        for hostname, options in document.items():
+            options = options or {}
+            endpoints = options.get("endpoints", [])
+            if isinstance(endpoints, str):
+                endpoints = endpoints.split(",")
+            record = {
+                "hostname": hostname,
+                "endpoints": [endpoint.strip() for endpoint in endpoints],
+                "sources": [{"name": "file", "type": "file", "id": path}],
+            }
+            if options.get("provider"):
+                record["provider"] = options["provider"]
+            if options.get("healthcheck"):
+                record["healthcheck"] = parse_check(options["healthcheck"])
+            records["{}:{}".format(path, hostname)] = record
+        return records
+
+    def _load_zone(self, path):
+        source = {"name": "file", "type": "file", "id": path}
+        try:
+            with open(path, "r") as stream:
+                if path.endswith(".ndjson"):
+                    records = list(from_ndjson(stream, source))
+                else:
+                    records = list(from_bind(stream, source, self.endpoints()))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Can't load Records of %s: %s", path, e)
+            return None
+        return {"{}:{}".format(path, record["hostname"]): record for record in records}
+
+    def snapshot(self):
+        records = {}
+        for file_records in self._files.values():
+            records.update(file_records)
+        return records
+
+    def changes(self, since=None):
+        changed = {}
+        removed = []
+        for path in sorted(self.watcher.changes()):
+            after = self._load(path) if os.path.exists(path) else {}
+            if after is None:
+                # Keep the last good version of a file that fails to parse,
+                # rather than deleting all of its Records at the providers
+                logger.warning("Keeping the last good Records of %s", path)
+                continue
+            before = self._files.pop(path, {})
+            if after:
+                self._files[path] = after
+            removed += [key for key in before if key not in after]
+            for key, record in after.items():
+                if before.get(key) != record:
+                    changed[key] = record
+            logger.info("Reloaded Records of %s", path)
+
+        previous = self.seq
+        if changed or removed:
+            self.seq += 1
+        if since != previous:
+            return ChangeSet(self.seq, self.snapshot(), [], True)
+        return ChangeSet(self.seq, changed, removed, False)
+
+    def close(self):
+        self.watcher.close()
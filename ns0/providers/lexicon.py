@@ -3,8 +3,39 @@ from lexicon.config import ConfigResolver as LexiconConfigResolver
 from logzero import logger
 
 
+def auth_token(provider_name, options=None):
+    """
+    Return the auth token Lexicon would use for a provider, or None.
+    `options` are the provider's ns0 options, see LexiconClient.
+    """
+    config = LexiconConfigResolver()
+    config.with_dict(dict_object={provider_name: options or {}}).with_env()
+    return config.resolve("lexicon:{}:auth_token".format(provider_name))
+
+
+class _ChangeSummary:
+    """Render Record set changes like '+1.2.3.4, -::1' only when logged."""
+
+    def __init__(self, changes):
+        self.changes = changes
+
+    def __str__(self):
+        return ", ".join(
+            "{}{}".format("+" if action == "create" else "-", content)
+            for (action, _, content) in self.changes
+        )
+
+
 class LexiconClient:
-    def __init__(self, provider_name, action, domain, name, type, content):
+    """
+    Lexicon call for one Record. `options` are the ns0 options of the
+    provider (ns0:<provider>:*, e.g. auth_token), which take precedence
+    over the LEXICON_* environment variables.
+    """
+
+    def __init__(
+        self, provider_name, action, domain, name, type, content, options=None
+    ):
 
         self.lexicon_config = {
             "provider_name": provider_name,
@@ -14,8 +45,9 @@ class LexiconClient:
             "type": type,
             "content": content,
         }
-        # print(self.lexicon_config)
+        self.options = options or {}
         self.config = LexiconConfigResolver()
+        self.config.with_dict(dict_object={provider_name: self.options})
         self.config.with_env().with_dict(dict_object=self.lexicon_config)
 
         self.client = LexClient(self.config)
@@ -27,32 +59,80 @@ class LexiconClient:
     def execute(self):
         # Check provider config before doing stuff
         results = ""
+        lexicon_config = self.lexicon_config
         if self.auth_token:
             results = self.client.execute()
-            # print(results)
             if results:
                 logger.info(
-                    "✓ {}: {} Record {} -> {}".format(
-                        self.config.resolve("lexicon:provider_name"),
-                        self.config.resolve("lexicon:action").upper(),
-                        self.config.resolve("lexicon:name")
-                        + "."
-                        + self.config.resolve("lexicon:domain"),
-                        self.config.resolve("lexicon:content"),
-                    )
+                    "✓ %s: %s Record %s.%s -> %s",
+                    lexicon_config["provider_name"],
+                    lexicon_config["action"].upper(),
+                    lexicon_config["name"],
+                    lexicon_config["domain"],
+                    lexicon_config["content"],
                 )
             else:
-                logger.error("Couldn't create Record: {}".format(results))
+                logger.error("Couldn't create Record: %s", results)
         else:
             logger.error(
-                "✗ {}: Missing auth_token. {} Record {} -> {} failed".format(
-                    self.config.resolve("lexicon:provider_name"),
-                    self.config.resolve("lexicon:action").upper(),
-                    self.config.resolve("lexicon:name")
-                    + "."
-                    + self.config.resolve("lexicon:domain"),
-                    self.config.resolve("lexicon:content"),
-                )
+                "✗ %s: Missing auth_token. %s Record %s.%s -> %s failed",
+                lexicon_config["provider_name"],
+                lexicon_config["action"].upper(),
+                lexicon_config["name"],
+                lexicon_config["domain"],
+                lexicon_config["content"],
             )
             results = False
         return results
+
+    def execute_batch(self, changes):
+        """
+        Apply a list of (action, type, content) changes to the Record set of
+        this client's name, authenticating against the provider only once.
+        If the provider doesn't cope with the batch, every change is retried
+        as a single Lexicon call. Creates and deletes are idempotent, so changes
+        already applied before the failure are safe to replay.
+        """
+        if not self.auth_token:
+            return self.execute()
+
+        provider_name = self.lexicon_config["provider_name"]
+        name = self.lexicon_config["name"]
+        domain = self.lexicon_config["domain"]
+        try:
+            provider = self.client.provider
+            provider.authenticate()
+            for (action, type, content) in changes:
+                if action == "create":
+                    result = provider.create_record(type, name, content)
+                else:
+                    result = provider.delete_record(None, type, name, content)
+                if not result:
+                    raise RuntimeError(
+                        "{} {} {} returned {}".format(action, type, content, result)
+                    )
+            logger.info(
+                "✓ %s: UPDATE Record set %s.%s -> %s",
+                provider_name,
+                name,
+                domain,
+                _ChangeSummary(changes),
+            )
+            return True
+        except Exception as e:
+            logger.warning(
+                "%s: batched update of %s.%s failed, "
+                "falling back to single Records: %s",
+                provider_name,
+                name,
+                domain,
+                e,
+            )
+
+        results = [
+            LexiconClient(
+                provider_name, action, domain, name, type, content, self.options
+            ).execute()
+            for (action, type, content) in changes
+        ]
+        return all(results)
@@ -0,0 +1,56 @@
+import collections
+
+# A batch of changes of a source. With `full`, `records` is the complete
+# state of the source and replaces everything it reported before.
+ChangeSet = collections.namedtuple("ChangeSet", ["seq", "records", "removed", "full"])
+
+
+class RecordSource:
+    """
+    Base class of Record sources.
+
+    A source reports its Records keyed by a key that is unique within the
+    source, in the format createRecords() expects:
+        {"hostname": ..., "endpoints": [...], "sources": [...], ...}
+    Every batch of changes gets the next sequence number of the source.
+    Consumers pass the last sequence number they've seen to changes() and
+    get only what changed since. Sources that can't track changes only
+    implement snapshot(); the difference between two snapshots is computed
+    here.
+    """
+
+    name = "source"
+
+    def __init__(self):
+        self.seq = 0
+        self._last = {}
+
+    def snapshot(self):
+        """Return all current Records of the source"""
+        raise NotImplementedError(
+            "This method must be implemented in the concrete sub-classes."
+        )
+
+    def changes(self, since=None):
+        """
+        Return a ChangeSet with the changes after sequence number `since`.
+        Consumers that are out of step get the full state.
+        """
+        previous = self.seq
+        records = self.snapshot()
+        changed = {
+            key: record
+            for key, record in records.items()
+            if self._last.get(key) != record
+        }
+        removed = [key for key in self._last if key not in records]
+        self._last = records
+        if changed or removed:
+            self.seq += 1
+
+        if since != previous:
+            return ChangeSet(self.seq, dict(records), [], True)
+        return ChangeSet(self.seq, changed, removed, False)
+
+    def close(self):
+        pass
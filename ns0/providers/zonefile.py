@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parsers of zone files: BIND zone files and NDJSON, one Record per line, in
+the format written by the zone tool (zone.py export).
+
+Both are generators, so zones of any size are parsed in constant memory.
+"""
+import itertools
+import json
+import os
+
+from logzero import logger
+
+# Extensions of the zone files written by imports, by format
+ZONE_FILE_EXTENSIONS = {"bind": ".zone", "ndjson": ".ndjson"}
+
+
+def _endpoints_for(endpoints, values):
+    """Map published values back to the Endpoints announcing them"""
+    found = []
+    for (type, content) in values:
+        for endpoint, interfaces in endpoints.items():
+            if content in interfaces.values():
+                if endpoint not in found:
+                    found.append(endpoint)
+                break
+        else:
+            logger.warning("No Endpoint announces %s %s, skipping", type, content)
+    return found
+
+
+def parse_bind_lines(stream):
+    """Yield (hostname, type, content, comment) for A/AAAA records"""
+    origin = ""
+    owner = None
+    for line in stream:
+        data, _, comment = line.partition(";")
+        if not data.strip():
+            continue
+
+        fields = data.split()
+        if fields[0].upper() == "$ORIGIN":
+            origin = fields[1].rstrip(".")
+            continue
+        if fields[0].startswith("$"):
+            continue
+
+        if not line[0].isspace():
+            owner = fields.pop(0)
+            if owner == "@":
+                owner = origin
+            elif not owner.endswith(".") and origin:
+                owner = "{}.{}".format(owner, origin)
+            owner = owner.rstrip(".")
+        elif owner is None:
+            # Indented lines continue the previous owner, there is none yet
+            logger.warning("Skipping record without owner: %s", line.strip())
+            continue
+
+        # Skip optional TTL and class
+        while fields and (fields[0].isdigit() or fields[0].upper() in ("IN", "CH")):
+            fields.pop(0)
+        if len(fields) < 2 or fields[0].upper() not in ("A", "AAAA"):
+            continue
+        yield owner, fields[0].upper(), fields[1], comment.strip()
+
+
+def from_bind(stream, source, endpoints=None):
+    """
+    Yield Records in the format of the ns0 sources from a BIND zone file.
+    Lines of the same hostname are expected to be adjacent, as in exports.
+    Lines without the ns0 comment of exports are mapped to the Endpoints
+    announcing their values, given as the ns0:endpoints mapping.
+    """
+    for hostname, lines in itertools.groupby(
+        parse_bind_lines(stream), key=lambda line: line[0]
+    ):
+        lines = list(lines)
+        record = {
+            "hostname": hostname,
+            "sources": [dict(source)],
+        }
+
+        options = {}
+        for token in lines[0][3].split():
+            key, _, value = token.partition("=")
+            options[key] = value
+        if options.get("endpoints"):
+            record["endpoints"] = options["endpoints"].split(",")
+        else:
+            record["endpoints"] = _endpoints_for(
+                endpoints or {}, [(type, content) for (_, type, content, _) in lines]
+            )
+        if options.get("provider"):
+            record["provider"] = options["provider"]
+
+        if record["endpoints"]:
+            yield record
+
+
+def from_ndjson(stream, source):
+    """Yield Records in the format of the ns0 sources from NDJSON"""
+    for line in stream:
+        if not line.strip():
+            continue
+        document = json.loads(line)
+        record = {
+            "hostname": document["hostname"],
+            "endpoints": document["endpoints"],
+            "sources": [dict(source)],
+        }
+        if document.get("provider"):
+            record["provider"] = document["provider"]
+        yield record
+
+
+def guess_format(path):
+    if os.path.splitext(path)[1] in (".ndjson", ".jsonl", ".json"):
+        return "ndjson"
+    return "bind"
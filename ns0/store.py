@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copy-on-write Record store of ns0.
+
+Readers get immutable snapshots without taking any lock. Writers prepare
+their changes in a transaction and publish a new snapshot with a single
+reference swap. Records are spread over buckets; a new snapshot copies only
+the buckets a transaction touched and shares all others with the previous
+snapshot. The number of buckets doubles as the store grows, so the buckets
+copied by a transaction stay small. Every transaction still copies the list
+of bucket references, which grows with the store, though much slower than
+the Records. Stored Records are frozen deeply: lists become tuples and
+nested dicts become read-only mappings.
+"""
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from types import MappingProxyType
+
+# Average number of Records per bucket above which the buckets are doubled
+BUCKET_SIZE = 64
+
+
+def _freeze(value):
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class Snapshot(Mapping):
+    """Immutable, versioned view of all Records at one point in time"""
+
+    __slots__ = ("version", "_buckets", "_len")
+
+    def __init__(self, buckets, version=0, length=0):
+        self.version = version
+        self._buckets = buckets
+        self._len = length
+
+    def _bucket(self, hostname):
+        return self._buckets[hash(hostname) % len(self._buckets)]
+
+    def __getitem__(self, hostname):
+        return self._bucket(hostname)[hostname]
+
+    def __contains__(self, hostname):
+        return hostname in self._bucket(hostname)
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            yield from bucket
+
+    def __len__(self):
+        return self._len
+
+
+class Transaction(Snapshot):
+    """
+    Pending changes of a writer. Reads see the writer's own changes.
+    Buckets are copied the first time they are written to.
+    """
+
+    __slots__ = ("_dirty",)
+
+    def __init__(self, snapshot):
+        super(Transaction, self).__init__(
+            list(snapshot._buckets), snapshot.version + 1, len(snapshot)
+        )
+        self._dirty = set()
+
+    def _writable(self, hostname):
+        rank = hash(hostname) % len(self._buckets)
+        if rank not in self._dirty:
+            self._buckets[rank] = dict(self._buckets[rank])
+            self._dirty.add(rank)
+        return self._buckets[rank]
+
+    def set(self, hostname, record):
+        """Add or replace a Record. Returns the stored, read-only Record."""
+        bucket = self._writable(hostname)
+        if hostname not in bucket:
+            self._len += 1
+        bucket[hostname] = _freeze(record)
+        return bucket[hostname]
+
+    def update(self, hostname, **fields):
+        """Replace a Record by a copy with the given fields changed"""
+        return self.set(hostname, dict(self[hostname], **fields))
+
+    def delete(self, hostname):
+        """Remove a Record. Returns the removed Record, or None."""
+        if hostname not in self:
+            return None
+        self._len -= 1
+        return self._writable(hostname).pop(hostname)
+
+    def publish(self):
+        buckets = self._buckets
+        if self._len > len(buckets) * BUCKET_SIZE:
+            count = len(buckets)
+            while self._len > count * BUCKET_SIZE:
+                count *= 2
+            buckets = [{} for _ in range(count)]
+            for bucket in self._buckets:
+                for hostname, record in bucket.items():
+                    buckets[hash(hostname) % count][hostname] = record
+        return Snapshot(tuple(buckets), self.version, self._len)
+
+
+class RecordStore(Mapping):
+    """
+    Thread-safe store of Records keyed by hostname.
+
+    Reading the store (or a snapshot taken with snapshot()) never blocks.
+    Writes happen in transactions, which are serialized among writers only:
+        $ with store.transaction() as txn:
+        $     txn.update('web.example.com', found=now)
+        $     txn.delete('old.example.com')
+    Stored Records are read-only mappings holding tuples instead of lists, and
+    are replaced instead of modified.
+    """
+
+    def __init__(self, records=None, buckets=256):
+        self._snapshot = Snapshot(tuple({} for _ in range(buckets)))
+        self._lock = threading.Lock()
+        if records:
+            with self.transaction() as txn:
+                for hostname, record in records.items():
+                    txn.set(hostname, record)
+
+    def snapshot(self):
+        """Return the current immutable snapshot"""
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    @contextmanager
+    def transaction(self):
+        """Collect writes and publish them atomically when the block exits"""
+        with self._lock:
+            txn = Transaction(self._snapshot)
+            yield txn
+            self._snapshot = txn.publish()
+
+    def set(self, hostname, record):
+        with self.transaction() as txn:
+            return txn.set(hostname, record)
+
+    def update(self, hostname, **fields):
+        with self.transaction() as txn:
+            return txn.update(hostname, **fields)
+
+    def delete(self, hostname):
+        with self.transaction() as txn:
+            return txn.delete(hostname)
+
+    def __getitem__(self, hostname):
+        return self._snapshot[hostname]
+
+    def __contains__(self, hostname):
+        return hostname in self._snapshot
+
+    def __iter__(self):
+        return iter(self._snapshot)
+
+    def __len__(self):
+        return len(self._snapshot)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Supervised execution of DNS provider operations.
+
+Lexicon provider plugins run in a dedicated pool of worker processes per
+provider. Each call has a hard timeout, workers are recycled after a number
+of calls and a circuit breaker stops calling a provider that keeps failing,
+so a single broken provider can't hold back the records of the others.
+"""
+import multiprocessing
+import threading
+import time
+
+from logs import setup_worker_logging
+from logzero import logger
+from providers.lexicon import LexiconClient
+
+
+def _execute(args):
+    """Build a LexiconClient inside the worker process and execute it."""
+    return LexiconClient(*args).execute()
+
+
+def _execute_rrset(args):
+    """Apply a batch of changes to the Record set of one name in the worker."""
+    provider_name, domain, name, changes, options = args
+    action, type, content = changes[0]
+    lex = LexiconClient(provider_name, action, domain, name, type, content, options)
+    return lex.execute_batch(changes)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker guarding a single provider.
+
+    The breaker opens after `threshold` consecutive failures. While open, calls
+    are rejected until `reset_timeout` seconds have passed. Then a single trial
+    call is let through (half-open): success closes the breaker again, failure
+    re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold=3, reset_timeout=60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be made right now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened >= self.reset_timeout:
+                    self.state = self.HALF_OPEN
+                    return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened = time.monotonic()
+
+
+class ProviderPool:
+    """
+    Pool of worker processes executing Lexicon calls for one provider.
+
+    A hung call is handled by retiring the pool it runs in: new calls go to
+    a fresh pool, and the retired pool, including the hung worker, is only
+    terminated once the other calls running in it have finished. Concurrent
+    callers aren't penalized for somebody else's hung call.
+    Workers are spawned rather than forked, as ns0 runs threads (logging,
+    health probes, sync executors) whose locks a forked child could inherit
+    in a locked state.
+    """
+
+    def __init__(self, provider_name, workers=2, max_calls=50, log_json=False):
+        self.provider_name = provider_name
+        self.workers = workers
+        self.max_calls = max_calls
+        self.log_json = log_json
+        # Concurrent callers wait for a free worker, so time spent waiting
+        # doesn't count against the timeout of their call
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._pool = self._spawn()
+        # pool -> number of calls running in it
+        self._running = {self._pool: 0}
+        self._retired = set()
+
+    def _spawn(self):
+        # maxtasksperchild recycles workers to contain leaks in provider plugins
+        return multiprocessing.get_context("spawn").Pool(
+            self.workers,
+            initializer=setup_worker_logging,
+            initargs=(logger.getEffectiveLevel(), self.log_json),
+            maxtasksperchild=self.max_calls,
+        )
+
+    def execute(self, func, args, timeout):
+        """
+        Execute a Lexicon call in the pool and wait at most `timeout` seconds.
+        Raises multiprocessing.TimeoutError if the call didn't finish in time,
+        after retiring the pool the call hangs in.
+        """
+        with self._slots:
+            with self._lock:
+                pool = self._pool
+                self._running[pool] += 1
+            try:
+                return pool.apply_async(func, (args,)).get(timeout)
+            except multiprocessing.TimeoutError:
+                self._retire(pool)
+                raise
+            finally:
+                self._release(pool)
+
+    def _retire(self, pool):
+        with self._lock:
+            if pool is self._pool:
+                self._pool = self._spawn()
+                self._running[self._pool] = 0
+            self._retired.add(pool)
+
+    def _release(self, pool):
+        with self._lock:
+            self._running[pool] -= 1
+            idle = pool in self._retired and not self._running[pool]
+            if idle:
+                self._retired.discard(pool)
+                del self._running[pool]
+        if idle:
+            pool.terminate()
+
+    def restart(self):
+        """Send new calls to fresh workers, retiring the current ones."""
+        with self._lock:
+            pool = self._pool
+            self._running[pool] += 1
+        self._retire(pool)
+        self._release(pool)
+
+    def close(self):
+        with self._lock:
+            pools = list(self._running)
+            self._running = {}
+            self._retired = set()
+        for pool in pools:
+            pool.terminate()
+            pool.join()
+
+
+class ProviderSupervisor:
+    """
+    Entry point for all provider operations of ns0.
+
+    Pools and circuit breakers are created lazily, one per provider. The
+    following configuration parameters are honored:
+        * ns0:provider_workers: worker processes per provider
+        * ns0:provider_timeout: hard timeout of a single call in seconds
+        * ns0:provider_max_calls: calls after which a worker is recycled
+        * ns0:breaker_threshold: consecutive failures opening the breaker
+        * ns0:breaker_reset: seconds before an open breaker is retried
+    The options of a provider (ns0:<provider>:*) are resolved for every call
+    and passed on to Lexicon, so configuration changes apply at once.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.workers = int(config.resolve("ns0:provider_workers"))
+        self.timeout = int(config.resolve("ns0:provider_timeout"))
+        self.max_calls = int(config.resolve("ns0:provider_max_calls"))
+        self.breaker_threshold = int(config.resolve("ns0:breaker_threshold"))
+        self.breaker_reset = int(config.resolve("ns0:breaker_reset"))
+        self.log_json = config.resolve("ns0:log_format") == "json"
+
+        self._pools = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider_name):
+        with self._lock:
+            if provider_name not in self._pools:
+                self._pools[provider_name] = ProviderPool(
+                    provider_name, self.workers, self.max_calls, self.log_json
+                )
+                self._breakers[provider_name] = CircuitBreaker(
+                    self.breaker_threshold, self.breaker_reset
+                )
+            return self._pools[provider_name], self._breakers[provider_name]
+
+    def execute(self, provider_name, action, domain, name, type, content):
+        """
+        Execute a single Lexicon operation for the given provider.
+        Returns the Lexicon result, or False if the call was rejected by the
+        circuit breaker or timed out. Exceptions raised by the provider are
+        re-raised after being accounted for by the circuit breaker.
+        """
+        return self._call(
+            provider_name,
+            _execute,
+            (
+                provider_name,
+                action,
+                domain,
+                name,
+                type,
+                content,
+                self.config.scoped("ns0:{}".format(provider_name)),
+            ),
+            "{} Record {}.{} -> {}".format(action.upper(), name, domain, content),
+        )
+
+    def execute_rrset(self, provider_name, domain, name, changes):
+        """
+        Apply all (action, type, content) changes of one name as a single batch.
+        Same return and error semantics as execute().
+        """
+        if not changes:
+            return True
+        return self._call(
+            provider_name,
+            _execute_rrset,
+            (
+                provider_name,
+                domain,
+                name,
+                list(changes),
+                self.config.scoped("ns0:{}".format(provider_name)),
+            ),
+            "UPDATE Record set {}.{} ({} changes)".format(name, domain, len(changes)),
+        )
+
+    def _call(self, provider_name, func, args, description):
+        pool, breaker = self._get(provider_name)
+
+        if not breaker.allow():
+            logger.warning(
+                "✗ %s: circuit open, skipping %s", provider_name, description
+            )
+            return False
+
+        try:
+            result = pool.execute(func, args, self.timeout)
+        except multiprocessing.TimeoutError:
+            logger.error(
+                "✗ %s: %s timed out after %ss, replacing workers",
+                provider_name,
+                description,
+                self.timeout,
+            )
+            breaker.failure()
+            return False
+        except Exception:
+            breaker.failure()
+            raise
+
+        if result:
+            breaker.success()
+        else:
+            breaker.failure()
+        return result
+
+    def state(self):
+        """Return the circuit breaker state of every known provider."""
+        with self._lock:
+            return {name: b.state for name, b in self._breakers.items()}
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+            self._breakers = {}
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lightweight change detection for files in a directory.
+
+inotify is used when the inotify_simple package is available (Linux),
+otherwise the directory is polled for changed modification times.
+"""
+import os
+import re
+import time
+
+from logzero import logger
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # pragma: no cover - optional dependency
+    INotify = None
+
+# When polling, files modified more recently may still be being written
+SETTLE_NS = 10 ** 9
+
+
+class DirectoryWatcher:
+    """
+    Watch a directory for files whose basename matches `pattern`.
+
+    changes() never blocks and returns the paths of matching files that were
+    created, modified or deleted since the previous call. When polling, a
+    file modified within the last second is only reported once its
+    modification time is the same in two consecutive scans, so files that
+    are still being written are left alone.
+    """
+
+    def __init__(self, dir_path, pattern):
+        self.dir_path = dir_path
+        self.pattern = re.compile(pattern)
+        self._mtimes = self._scan()
+        # Result of the latest poll, changes are reported once they settle
+        self._seen = dict(self._mtimes)
+        self._inotify = None
+
+        if INotify is not None:
+            try:
+                self._inotify = INotify()
+                self._inotify.add_watch(
+                    dir_path,
+                    flags.CLOSE_WRITE
+                    | flags.CREATE
+                    | flags.DELETE
+                    | flags.MOVED_TO
+                    | flags.MOVED_FROM,
+                )
+            except OSError as e:
+                logger.warning(
+                    "inotify unavailable for %s, polling instead: %s", dir_path, e
+                )
+                self._inotify = None
+
+    def _scan(self):
+        mtimes = {}
+        for basename in os.listdir(self.dir_path):
+            if not self.pattern.search(basename):
+                continue
+            path = os.path.join(self.dir_path, basename)
+            try:
+                if os.path.isfile(path):
+                    mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                # File vanished between listdir and stat
+                pass
+        return mtimes
+
+    def paths(self):
+        """Return the matching files currently known to exist."""
+        return sorted(self._mtimes)
+
+    def changes(self):
+        """Return the set of matching paths that changed since the last call."""
+        if self._inotify is not None:
+            changed = set()
+            for event in self._inotify.read(timeout=0):
+                if event.name and self.pattern.search(event.name):
+                    changed.add(os.path.join(self.dir_path, event.name))
+            if changed:
+                self._mtimes = self._scan()
+                self._seen = dict(self._mtimes)
+            return changed
+
+        now = time.time_ns()
+        mtimes = self._scan()
+        changed = {
+            path
+            for path in set(mtimes) | set(self._mtimes)
+            if mtimes.get(path) != self._mtimes.get(path)
+            and (
+                path not in mtimes
+                or mtimes[path] == self._seen.get(path)
+                or now - mtimes[path] >= SETTLE_NS
+            )
+        }
+        self._seen = mtimes
+        for path in changed:
+            if path in mtimes:
+                self._mtimes[path] = mtimes[path]
+            else:
+                self._mtimes.pop(path, None)
+        return changed
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
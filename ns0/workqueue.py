@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyed priority queue of pending Record set operations.
+
+There is at most one pending operation per hostname. Operations are planned
+against the published state of a hostname, which only changes once an
+operation has been executed, so a newer operation always supersedes an older
+pending one. A create that follows a pending delete of the same values
+collapses into a no-op, and no provider call is wasted on it.
+"""
+import heapq
+import itertools
+
+from logzero import logger
+
+DEFAULT_PRIORITIES = "delete,withdraw,update,create"
+
+
+def kind(op):
+    """
+    Classify an operation:
+        * noop: nothing to send to the provider
+        * delete: the whole Record is removed
+        * withdraw: values are only removed, e.g. stale IPs
+        * create: values are only added
+        * update: values are added and removed
+    """
+    if op["action"] == "delete":
+        return "delete" if op["delete"] else "noop"
+    if op["create"] and op["delete"]:
+        return "update"
+    if op["create"]:
+        return "create"
+    if op["delete"]:
+        return "withdraw"
+    return "noop"
+
+
+class OperationQueue:
+    """
+    Priority queue of operations keyed by hostname.
+    `priorities` orders the kinds of operations, highest priority first, as a
+    list or a comma separated string. No-ops always come first, as they are
+    free. Operations of the same priority are executed in arrival order.
+    """
+
+    def __init__(self, priorities=DEFAULT_PRIORITIES):
+        if isinstance(priorities, str):
+            priorities = [p.strip() for p in priorities.split(",")]
+        self.priorities = {"noop": -1}
+        for rank, name in enumerate(priorities):
+            self.priorities[name] = rank
+        self.superseded = 0
+
+        # Heap entries are [priority, seq, op]. Superseded entries stay in
+        # the heap with op set to None, and are skipped when popped.
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, hostname):
+        return hostname in self._entries
+
+    def get(self, hostname):
+        """Return the pending operation of a hostname, or None"""
+        entry = self._entries.get(hostname)
+        return entry[2] if entry else None
+
+    def push(self, op):
+        """Queue an operation, superseding any pending one of its hostname"""
+        previous = self._entries.pop(op["hostname"], None)
+        if previous is not None:
+            logger.debug(
+                "Superseding pending %s of %s", kind(previous[2]), op["hostname"]
+            )
+            previous[2] = None
+            self.superseded += 1
+
+        priority = self.priorities.get(kind(op), len(self.priorities))
+        entry = [priority, next(self._seq), op]
+        self._entries[op["hostname"]] = entry
+        heapq.heappush(self._heap, entry)
+
+    def pop(self):
+        """Remove and return the operation with the highest priority"""
+        while self._heap:
+            _, _, op = heapq.heappop(self._heap)
+            if op is not None:
+                del self._entries[op["hostname"]]
+                return op
+        raise KeyError("pop from an empty OperationQueue")
+
+    def drain(self):
+        """Pop all pending operations in priority order"""
+        while self._entries:
+            yield self.pop()
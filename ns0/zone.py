@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Export and import the Records managed by ns0 as BIND zone files or NDJSON.
+
+Exports are built from generators, so zones of any size are written in
+constant memory.
+    $ python ns0/zone.py export --format bind > ns0.zone
+    $ python ns0/zone.py import ns0.zone
+
+The zone tool doesn't sync with the sources or the providers. Exports only
+contain the Records ns0 has published if ns0:journal_path is configured,
+as the published state is restored from the journal. Without a journal,
+only the system Records are exported, plus the Records found by the sources
+with --discover.
+Imports are a source like any other: the zone file is copied into the
+ns0:records_dir directory, where the running ns0 picks it up and publishes
+its Records. Removing the file deletes them again.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from config import ConfigResolver
+from logzero import logger
+from ns0 import NS0
+from providers.zonefile import (
+    ZONE_FILE_EXTENSIONS,
+    from_bind,
+    from_ndjson,
+    guess_format,
+)
+
+
+def iter_records(ns0, discover=False):
+    """
+    Yield (hostname, record, values) for the Records of a ns0 instance, with
+    the values they are (or would be) published with.
+    With `discover`, Records found by the sources but not published yet are
+    included too.
+    """
+    snapshot = ns0.records.snapshot()
+    for hostname in snapshot:
+        record = snapshot[hostname]
+        values = record.get("values") or ns0.resolveValues(record["endpoints"])
+        yield hostname, record, values
+
+    if discover:
+        for record in ns0.collectRecords().values():
+            if record["hostname"] not in snapshot:
+                yield record["hostname"], record, ns0.resolveValues(record["endpoints"])
+
+
+def to_bind(entries, default_ttl=0):
+    """
+    Yield BIND zone file lines. The ns0 Endpoints and provider of a Record are
+    kept in a trailing comment, so the file can be imported again losslessly.
+    """
+    yield "; Exported by ns0\n"
+    for hostname, record, values in entries:
+        ttl = record.get("ttl") or default_ttl
+        comment = "; ns0 endpoints={}".format(",".join(record["endpoints"]))
+        if record.get("provider"):
+            comment += " provider={}".format(record["provider"])
+        for (type, content) in values:
+            yield "{}.\t{}\tIN\t{}\t{}\t{}\n".format(
+                hostname, ttl, type, content, comment
+            )
+
+
+def to_ndjson(entries):
+    """Yield one JSON document per Record"""
+    for hostname, record, values in entries:
+        yield json.dumps(
+            {
+                "hostname": hostname,
+                "endpoints": list(record["endpoints"]),
+                "provider": record.get("provider"),
+                "ttl": record.get("ttl"),
+                "values": [list(value) for value in values],
+            }
+        ) + "\n"
+
+
+def export_zone(ns0, output, format="bind", discover=False):
+    if ns0.journal is None:
+        logger.warning(
+            "No ns0:journal_path configured, only the system Records%s are exported",
+            " and the Records found by the sources" if discover else "",
+        )
+    entries = iter_records(ns0, discover)
+    if format == "ndjson":
+        lines = to_ndjson(entries)
+    else:
+        lines = to_bind(entries, ns0.config.resolve("ns0:ttl"))
+    for line in lines:
+        output.write(line)
+
+
+def import_zone(config, path, format=None):
+    """
+    Copy a zone file into ns0:records_dir, for the running ns0 to publish.
+    The file is parsed first, so only valid zones are handed over, and
+    replaced atomically, so ns0 never reads a partial copy.
+    Returns the number of Records found in the file.
+    """
+    records_dir = config.resolve("ns0:records_dir")
+    if not records_dir:
+        raise ValueError("ns0:records_dir must be configured to import zones")
+
+    format = format or guess_format(path)
+    source = {"name": "zonefile", "type": "file", "id": path}
+    with open(path, "r") as stream:
+        if format == "ndjson":
+            records = from_ndjson(stream, source)
+        else:
+            records = from_bind(stream, source, config.resolve("ns0:endpoints"))
+        count = sum(1 for _ in records)
+
+    name = os.path.splitext(os.path.basename(path))[0] + ZONE_FILE_EXTENSIONS[format]
+    target = os.path.join(records_dir, name)
+    # Not matching the pattern of record files, ns0 ignores the partial copy
+    fd, temp_path = tempfile.mkstemp(dir=records_dir, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as output, open(path, "r") as stream:
+            shutil.copyfileobj(stream, output)
+        os.replace(temp_path, target)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    logger.info("Imported %s Records from %s into %s", count, path, target)
+    return count
+
+
+def main(args):
+    """ Main entry point of the zone tool """
+    if args.command == "import":
+        # The running ns0 publishes imports, see import_zone()
+        config = ConfigResolver().with_env()
+        if args.config_dir:
+            config.with_config_dir(args.config_dir)
+        import_zone(config, args.path, args.format)
+        return
+
+    # Don't sync with the sources, we only work on the Running Config
+    ns0 = NS0(config_dir=args.config_dir, sync=False)
+    try:
+        if args.output:
+            with open(args.output, "w") as output:
+                export_zone(ns0, output, args.format, args.discover)
+        else:
+            export_zone(ns0, sys.stdout, args.format, args.discover)
+    finally:
+        ns0.close()
+
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    PARSER.add_argument(
+        "-c",
+        "--config-dir",
+        action="store",
+        dest="config_dir",
+        default=os.environ.get("NS0_CONFIG_DIR"),
+    )
+    COMMANDS = PARSER.add_subparsers(dest="command")
+    COMMANDS.required = True
+
+    EXPORT = COMMANDS.add_parser("export", help="Write the Records to a zone file")
+    EXPORT.add_argument("-f", "--format", choices=["bind", "ndjson"], default="bind")
+    EXPORT.add_argument("-o", "--output", help="Output file (default: stdout)")
+    EXPORT.add_argument(
+        "--discover",
+        action="store_true",
+        default=False,
+        help="Include Records found by the sources but not published yet",
+    )
+
+    IMPORT = COMMANDS.add_parser(
+        "import", help="Hand the Records of a zone file to the running ns0"
+    )
+    IMPORT.add_argument("path")
+    IMPORT.add_argument("-f", "--format", choices=["bind", "ndjson"], default=None)
+
+    MYARGS = PARSER.parse_args()
+    main(MYARGS)
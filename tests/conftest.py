@@ -0,0 +1,10 @@
+import os
+import sys
+
+# ns0 runs as a script from its own directory, modules import each other
+# by their top-level names
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "ns0"))
+
+# Import ns0/ns0.py before the ns0/ package of the same name can shadow it
+sys.modules.pop("ns0", None)
+import ns0  # noqa: E402,F401
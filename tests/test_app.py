@@ -0,0 +1,50 @@
+import argparse
+import datetime
+import signal
+import types
+
+import app
+import churn
+import pytest
+
+
+class Stop(Exception):
+    pass
+
+
+@pytest.fixture
+def signals():
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGUSR1, signal.SIGUSR2)}
+    yield
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+
+
+def test_main_profiles_the_cycle_after_sigusr1(monkeypatch, tmp_path, signals):
+    monkeypatch.setenv("NS0_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        app,
+        "NS0",
+        lambda config_dir: churn.ReplayNS0(datetime.datetime.now, config_dir),
+    )
+
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 1:
+            signal.getsignal(signal.SIGUSR1)(signal.SIGUSR1, None)
+        else:
+            raise Stop()
+
+    monkeypatch.setattr(app, "time", types.SimpleNamespace(sleep=sleep))
+
+    with pytest.raises(Stop):
+        app.main(argparse.Namespace(config_dir=None))
+
+    assert len(sleeps) == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "cycle-2.collapsed",
+        "cycle-2.json",
+        "cycle-2.prof",
+    ]
@@ -0,0 +1,115 @@
+import gzip
+import json
+
+import churn
+
+
+class _Events:
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def close(self):
+        self.closed = True
+
+
+class _Client:
+    """Stands in for docker.DockerClient while recording"""
+
+    def __init__(self, running, events):
+        self.containers = churn.FakeContainers()
+        for container in running:
+            self.containers.running[container.id] = container
+        self.stream = _Events(events)
+
+    def events(self, **kwargs):
+        return self.stream
+
+
+def _event(action, container_id, **attributes):
+    return {"Action": action, "Actor": {"ID": container_id, "Attributes": attributes}}
+
+
+def test_anonymizer_keeps_the_shape_of_hostnames():
+    anonymizer = churn.Anonymizer()
+    pseudonym = anonymizer.hostname("*.web.ns0.co")
+
+    assert pseudonym.startswith("*.") and pseudonym.endswith(".example.com")
+    assert pseudonym.count(".") == "*.web.ns0.co".count(".")
+    assert "web" not in pseudonym
+    # Stable within a recording, names of the same zone share their suffix
+    assert anonymizer.hostname("*.web.ns0.co") == pseudonym
+    assert anonymizer.hostname("api.web.ns0.co").endswith(pseudonym[1:])
+    assert churn.Anonymizer().hostname("*.web.ns0.co") != pseudonym
+
+    assert [anonymizer.container(id) for id in ("abc", "def", "abc")] == [
+        "c1",
+        "c2",
+        "c1",
+    ]
+    assert anonymizer.labels({"ns0.web.hostname": "ns0.co", "ns0.web.ttl": "60"}) == {
+        "ns0.web.hostname": anonymizer.hostname("ns0.co"),
+        "ns0.web.ttl": "60",
+    }
+
+
+def test_record_writes_ns0_containers_and_their_events(tmp_path):
+    labels = {"ns0.web.hostname": "web.ns0.co", "maintainer": "ns0"}
+    client = _Client(
+        [churn.FakeContainer("a", labels), churn.FakeContainer("b", {"x": "y"})],
+        [
+            _event("start", "c", **{"ns0.api.hostname": "api.ns0.co"}),
+            _event("start", "d", maintainer="ns0"),
+            _event("die", "d"),
+            _event("die", "a"),
+            _event("exec_start", "c"),
+        ],
+    )
+    path = str(tmp_path / "churn.ndjson.gz")
+
+    assert churn.record(client, path, anonymize=True) == 3
+    assert client.stream.closed
+
+    events = list(churn.read_trace(path))
+    assert [(event["a"], event["c"]) for event in events] == [
+        ("start", "c1"),
+        ("start", "c2"),
+        ("stop", "c1"),
+    ]
+    assert list(events[0]["l"]) == ["ns0.web.hostname"]
+    assert events[0]["l"]["ns0.web.hostname"].endswith(".example.com")
+    assert "l" not in events[2]
+
+
+def _write_trace(path, events):
+    with gzip.open(path, "wt") as stream:
+        stream.write(json.dumps({"version": churn.TRACE_VERSION}) + "\n")
+        for event in events:
+            stream.write(json.dumps(event) + "\n")
+
+
+def test_replay_converges_and_counts_provider_calls(tmp_path):
+    path = str(tmp_path / "churn.ndjson.gz")
+    web = {"ns0.web.hostname": "web.ns0.co", "ns0.web.endpoints": "public"}
+    api = {"ns0.api.hostname": "api.ns0.co", "ns0.api.endpoints": "public,zerotier"}
+    _write_trace(
+        path,
+        [
+            {"t": 0, "a": "start", "c": "a", "l": web},
+            {"t": 5, "a": "start", "c": "b", "l": api},
+            {"t": 30, "a": "stop", "c": "a"},
+        ],
+    )
+
+    report = churn.replay(path, speed=0, config_dir=str(tmp_path))
+
+    assert report["events"] == 3
+    assert report["converged"] == 3 and report["unconverged"] == 0
+    # The A and AAAA Records of web.ns0.co are created and deleted again,
+    # api.ns0.co has those of two Endpoints
+    assert report["changes"] == {"create": 6, "delete": 2}
+    assert report["calls"] == 3
+    assert report["latency"]["max"] is not None
@@ -0,0 +1,65 @@
+import itertools
+import os
+import time
+
+from config import ConfigDirWatcher, ConfigResolver, EnvironmentConfigSource
+
+_mtimes = itertools.count(time.time_ns() - 100 * 10 ** 9, 10 ** 9)
+
+
+def _write(path, text):
+    # Distinct modification times in the past, so polling doesn't wait for
+    # the writes to settle
+    path.write_text(text)
+    mtime = next(_mtimes)
+    os.utime(str(path), ns=(mtime, mtime))
+
+
+def test_scoped_merges_sources_by_priority(monkeypatch):
+    monkeypatch.setenv("NS0_CLOUDFLARE_AUTH_TOKEN", "from-env")
+    config = ConfigResolver()
+    config.with_config_source(EnvironmentConfigSource())
+    config.with_dict(
+        {"cloudflare": {"auth_token": "from-dict", "auth_username": "ns0"}, "ttl": 1}
+    )
+
+    assert config.scoped("ns0:cloudflare") == {
+        "auth_token": "from-env",
+        "auth_username": "ns0",
+    }
+    assert config.scoped("ns0:route53") == {}
+
+
+def test_config_dir_watcher_reports_changed_keys(tmp_path):
+    (tmp_path / "ns0.yml").write_text("ttl: 10\nupdate_interval: 5\n")
+    (tmp_path / "ns0_cloudflare.yml").write_text("auth_token: OLD\n")
+    config = ConfigResolver()
+    watcher = ConfigDirWatcher(config, str(tmp_path))
+    config.with_dict({"ttl": 1, "log_format": "text"})
+
+    try:
+        assert config.resolve("ns0:ttl") == 10
+        _write(tmp_path / "ns0.yml", "ttl: 20\nupdate_interval: 5\n")
+        _write(tmp_path / "ns0_cloudflare.yml", "auth_token: NEW\n")
+        _write(tmp_path / "ns0_route53.yml", "auth_token: ROUTE53\n")
+
+        assert watcher.reload() == {
+            "ns0:ttl",
+            "ns0:cloudflare:auth_token",
+            "ns0:route53:auth_token",
+        }
+        assert config.resolve("ns0:ttl") == 20
+        assert config.resolve("ns0:cloudflare:auth_token") == "NEW"
+
+        # A file that fails to parse keeps its last good version
+        _write(tmp_path / "ns0.yml", "ttl: [20\n")
+        assert watcher.reload() == set()
+        assert config.resolve("ns0:ttl") == 20
+
+        (tmp_path / "ns0_route53.yml").unlink()
+        assert watcher.reload() == {"ns0:route53:auth_token"}
+        assert config.resolve("ns0:route53:auth_token") is None
+        # The defaults still rank below the config directory
+        assert config.resolve("ns0:log_format") == "text"
+    finally:
+        watcher.close()
@@ -0,0 +1,84 @@
+import os
+import time
+
+from providers.file import FileSource
+
+# Modification times in the past, so the watcher doesn't wait for writes to end
+_PAST = time.time_ns() - 100 * 10 ** 9
+
+
+def _write(path, text, mtime):
+    path.write_text(text)
+    os.utime(str(path), ns=(mtime, mtime))
+
+
+def test_parse_error_keeps_last_good_records(tmp_path):
+    path = tmp_path / "records.yml"
+    _write(path, "web.example.com:\n  endpoints: [public]\n", _PAST)
+    source = FileSource(str(tmp_path))
+    seq = source.changes().seq
+
+    _write(path, "web.example.com:\n  endpoints: [public\n", _PAST + 10 ** 9)
+    changes = source.changes(seq)
+
+    assert changes == (seq, {}, [], False)
+    assert list(source.snapshot()) == ["{}:web.example.com".format(path)]
+
+
+def test_changes_of_modified_and_deleted_files(tmp_path):
+    web = tmp_path / "web.yml"
+    api = tmp_path / "api.json"
+    _write(web, "web.ns0.co:\n  endpoints: public, zerotier\n", _PAST)
+    _write(api, '{"api.ns0.co": {"endpoints": ["public"]}}', _PAST)
+    (tmp_path / "notes.txt").write_text("not a record file")
+    source = FileSource(str(tmp_path))
+
+    full = source.changes()
+    assert full.full
+    assert sorted(record["hostname"] for record in full.records.values()) == [
+        "api.ns0.co",
+        "web.ns0.co",
+    ]
+    assert full.records["{}:web.ns0.co".format(web)]["endpoints"] == [
+        "public",
+        "zerotier",
+    ]
+
+    _write(
+        web,
+        "web.ns0.co:\n  endpoints: [public]\n"
+        "db.ns0.co:\n  endpoints: [local]\n  healthcheck: tcp:5432\n",
+        _PAST + 10 ** 9,
+    )
+    api.unlink()
+    changes = source.changes(full.seq)
+
+    assert not changes.full
+    assert changes.seq == full.seq + 1
+    assert changes.removed == ["{}:api.ns0.co".format(api)]
+    assert sorted(changes.records) == [
+        "{}:db.ns0.co".format(web),
+        "{}:web.ns0.co".format(web),
+    ]
+    assert changes.records["{}:db.ns0.co".format(web)]["healthcheck"] == {
+        "type": "tcp",
+        "port": 5432,
+    }
+    # Unchanged files report nothing new, consumers out of step get everything
+    assert source.changes(changes.seq) == (changes.seq, {}, [], False)
+    assert source.changes(full.seq).full
+    source.close()
+
+
+def test_documents_of_the_wrong_shape_keep_last_good_records(tmp_path):
+    path = tmp_path / "records.yml"
+    _write(path, "web.ns0.co:\n  endpoints: [public]\n", _PAST)
+    source = FileSource(str(tmp_path))
+    seq = source.changes().seq
+
+    for mtime, text in enumerate(["- web.ns0.co\n", "web.ns0.co: public\n"], 2):
+        _write(path, text, _PAST + mtime * 10 ** 9)
+        assert source.changes(seq) == (seq, {}, [], False)
+
+    assert list(source.snapshot()) == ["{}:web.ns0.co".format(path)]
+    source.close()
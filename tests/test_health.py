@@ -0,0 +1,28 @@
+import time
+
+import pytest
+from health import EVICT_INTERVALS, HealthProber, parse_check
+
+
+@pytest.fixture
+def prober():
+    instance = HealthProber(interval=0.1, timeout=1)
+    yield instance
+    instance.close()
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_targets_not_asked_for_are_evicted(prober):
+    check = parse_check("tcp:1")
+    _wait_for(lambda: prober.status(check, "127.0.0.1") is False)
+    assert prober.metrics() == {"tcp:127.0.0.1:1": (False, pytest.approx(0, abs=1))}
+
+    time.sleep(EVICT_INTERVALS * prober.interval + 0.05)
+    assert prober.metrics() == {}
+    assert prober._results == {}
@@ -0,0 +1,43 @@
+from index import HostnameIndex
+
+
+def test_match_prefers_exact_names_over_wildcards():
+    index = HostnameIndex()
+    index.add("*.here.ns0.co", "wildcard")
+    index.add("web.here.ns0.co", "web")
+
+    assert index.match("web.here.ns0.co") == ("web.here.ns0.co", "web")
+    assert index.match("WEB.here.ns0.co.") == ("web.here.ns0.co", "web")
+    assert index.match("api.here.ns0.co") == ("*.here.ns0.co", "wildcard")
+    assert index.match("a.b.here.ns0.co") == ("*.here.ns0.co", "wildcard")
+    assert index.match("here.ns0.co") == (None, None)
+    assert index.match("api.ns0.co") == (None, None)
+
+
+def test_group_and_remove():
+    index = HostnameIndex()
+    index.add("web.ns0.co", 1)
+    index.add("api.ns0.co", 2)
+    index.add("web.example.com", 3)
+
+    groups = index.group(["ns0.co", "example.com", "unknown.org"])
+    assert sorted(groups["ns0.co"]) == ["api.ns0.co", "web.ns0.co"]
+    assert groups["example.com"] == ["web.example.com"]
+    assert groups["unknown.org"] == []
+
+    assert index.remove("web.ns0.co") is True
+    assert index.remove("web.ns0.co") is False
+    assert len(index) == 2
+    assert "web.ns0.co" not in index
+
+
+def test_claim_reports_conflicting_sources_of_the_current_generation():
+    index = HostnameIndex()
+    assert index.claim("web.ns0.co", "docker:1", ["public"]) == []
+    assert index.claim("web.ns0.co", "docker:2", ["public "]) == []
+    assert index.claim("web.ns0.co", "docker:3", ["zerotier"]) == [
+        "docker:1",
+        "docker:2",
+    ]
+    # Claims of earlier generations are stale
+    assert index.claim("web.ns0.co", "docker:4", ["local"], generation=1) == []
@@ -0,0 +1,96 @@
+from journal import Journal
+
+
+def _op(hostname, values, action="update"):
+    return {
+        "action": action,
+        "hostname": hostname,
+        "provider": "mock",
+        "create": values,
+        "delete": [],
+        "values": values,
+    }
+
+
+def test_replay_restores_state_and_pending_operations(tmp_path):
+    path = str(tmp_path / "ns0.journal")
+    journal = Journal(path)
+    done = journal.plan(_op("web.ns0.co", [("A", "192.0.2.1")]))
+    pending = journal.plan(_op("api.ns0.co", [("A", "192.0.2.2")]))
+    failed = journal.plan(_op("db.ns0.co", [("A", "192.0.2.3")]))
+    journal.done(done)
+    journal.done(failed, ok=False)
+    journal.commit()
+    journal.close()
+
+    journal = Journal(path)
+    assert journal.state == {
+        "web.ns0.co": {"provider": "mock", "values": [("A", "192.0.2.1")]}
+    }
+    assert [op["seq"] for op in journal.pending()] == [pending]
+    assert journal.pending()[0]["values"] == [("A", "192.0.2.2")]
+    # New operations continue the sequence
+    assert journal.plan(_op("new.ns0.co", [])) == failed + 1
+    journal.close()
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / "ns0.journal"
+    journal = Journal(str(path))
+    seq = journal.plan(_op("web.ns0.co", [("A", "192.0.2.1")]))
+    journal.commit()
+    journal.close()
+    with open(str(path), "a") as stream:
+        stream.write('{"type": "done", "se')
+
+    journal = Journal(str(path))
+    assert journal.state == {}
+    assert [op["seq"] for op in journal.pending()] == [seq]
+    # Entries appended after the torn write are read back
+    journal.done(seq)
+    journal.done(journal.plan(_op("api.ns0.co", [("A", "192.0.2.2")])))
+    journal.commit()
+    journal.close()
+
+    journal = Journal(str(path))
+    assert sorted(journal.state) == ["api.ns0.co", "web.ns0.co"]
+    assert journal.pending() == []
+    journal.close()
+
+
+def test_missing_newline_of_the_last_entry(tmp_path):
+    path = tmp_path / "ns0.journal"
+    journal = Journal(str(path))
+    journal.plan(_op("web.ns0.co", [("A", "192.0.2.1")]))
+    journal.commit()
+    journal.close()
+    path.write_text(path.read_text().rstrip("\n"))
+
+    journal = Journal(str(path))
+    journal.done(1)
+    journal.commit()
+    journal.close()
+
+    journal = Journal(str(path))
+    assert list(journal.state) == ["web.ns0.co"]
+    assert journal.pending() == []
+    journal.close()
+
+
+def test_compaction_keeps_state_and_pending_operations(tmp_path):
+    path = tmp_path / "ns0.journal"
+    journal = Journal(str(path), compact_after=2)
+    journal.done(journal.plan(_op("web.ns0.co", [("A", "192.0.2.1")])))
+    journal.done(journal.plan(_op("web.ns0.co", [], action="delete")))
+    journal.done(journal.plan(_op("api.ns0.co", [("A", "192.0.2.2")])))
+    pending = journal.plan(_op("db.ns0.co", [("A", "192.0.2.3")]))
+    journal.commit()
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    journal.close()
+
+    journal = Journal(str(path))
+    assert list(journal.state) == ["api.ns0.co"]
+    assert [op["seq"] for op in journal.pending()] == [pending]
+    journal.close()
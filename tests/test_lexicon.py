@@ -0,0 +1,104 @@
+import providers.lexicon
+from providers.lexicon import LexiconClient, auth_token
+
+
+def test_ns0_options_reach_lexicon(monkeypatch):
+    monkeypatch.delenv("LEXICON_CLOUDFLARE_AUTH_TOKEN", raising=False)
+    options = {"auth_token": "SECRET_TOKEN"}
+
+    assert auth_token("cloudflare") is None
+    assert auth_token("cloudflare", options) == "SECRET_TOKEN"
+    client = LexiconClient(
+        "cloudflare", "create", "ns0.co", "web", "A", "192.0.2.1", options
+    )
+    assert client.auth_token == "SECRET_TOKEN"
+
+
+class _Provider:
+    """Lexicon provider failing at the `fail_at`th change of a batch"""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.authenticated = 0
+        self.changes = []
+
+    def authenticate(self):
+        self.authenticated += 1
+
+    def _change(self, action, type, name, content):
+        if len(self.changes) == self.fail_at:
+            raise RuntimeError("connection reset")
+        self.changes.append((action, type, name, content))
+        return True
+
+    def create_record(self, type, name, content):
+        return self._change("create", type, name, content)
+
+    def delete_record(self, identifier, type, name, content):
+        return self._change("delete", type, name, content)
+
+
+def _fake_lexicon(monkeypatch, provider):
+    """Replace Lexicon's client, single calls are recorded as calls"""
+    calls = []
+
+    class Client:
+        def __init__(self, config):
+            self.config = config
+            self.provider = provider
+
+        def execute(self):
+            calls.append(
+                tuple(
+                    self.config.resolve("lexicon:{}".format(key))
+                    for key in ("action", "type", "name", "content")
+                )
+            )
+            return True
+
+    monkeypatch.setattr(providers.lexicon, "LexClient", Client)
+    return calls
+
+
+_CHANGES = [
+    ("create", "A", "192.0.2.1"),
+    ("create", "AAAA", "2001:db8::1"),
+    ("delete", "A", "192.0.2.2"),
+]
+
+
+def _client(options):
+    return LexiconClient("mock", "create", "ns0.co", "web", "A", "192.0.2.1", options)
+
+
+def test_execute_batch_authenticates_once(monkeypatch):
+    provider = _Provider()
+    calls = _fake_lexicon(monkeypatch, provider)
+
+    assert _client({"auth_token": "TOKEN"}).execute_batch(_CHANGES)
+    assert provider.authenticated == 1
+    assert provider.changes == [
+        (action, type, "web", content) for (action, type, content) in _CHANGES
+    ]
+    assert calls == []
+
+
+def test_execute_batch_falls_back_to_single_calls(monkeypatch):
+    provider = _Provider(fail_at=1)
+    calls = _fake_lexicon(monkeypatch, provider)
+
+    assert _client({"auth_token": "TOKEN"}).execute_batch(_CHANGES)
+    # Applied before the failure, and replayed one call per value
+    assert provider.changes == [("create", "A", "web", "192.0.2.1")]
+    assert calls == [
+        (action, type, "web", content) for (action, type, content) in _CHANGES
+    ]
+
+
+def test_execute_batch_without_auth_token(monkeypatch):
+    monkeypatch.delenv("LEXICON_MOCK_AUTH_TOKEN", raising=False)
+    provider = _Provider()
+    calls = _fake_lexicon(monkeypatch, provider)
+
+    assert _client({}).execute_batch(_CHANGES) is False
+    assert provider.authenticated == 0 and calls == []
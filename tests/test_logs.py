@@ -0,0 +1,103 @@
+import logging
+
+import logs
+import pytest
+from logs import restore_logging, setup_logging
+from logzero import logger
+from supervisor import ProviderPool
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "ns0.log"
+    handler = logging.FileHandler(str(path))
+    saved = list(logger.handlers)
+    for existing in saved:
+        logger.removeHandler(existing)
+    logger.addHandler(handler)
+    yield path
+    restore_logging()
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+    for existing in saved:
+        logger.addHandler(existing)
+    handler.close()
+
+
+def _log_in_worker(message):
+    logger.error("%s", message)
+    return True
+
+
+def test_provider_workers_log_directly(capfd):
+    listener = setup_logging()
+    pool = ProviderPool("mock", workers=1)
+    try:
+        assert pool.execute(_log_in_worker, "logged by a worker", 30)
+    finally:
+        pool.close()
+        listener.stop()
+    assert "logged by a worker" in capfd.readouterr().err
+
+
+def test_stop_restores_the_original_handlers(log_file):
+    listener = setup_logging()
+    logger.error("queued")
+    listener.stop()
+    logger.error("direct")
+    assert "queued" in log_file.read_text()
+    assert "direct" in log_file.read_text()
+
+    # Logging can be set up again, e.g. for the next trace of a replay
+    listener = setup_logging()
+    assert listener is not None
+    listener.stop()
+
+
+def _record(msg, level=logging.WARNING, args=("web.ns0.co",), **extra):
+    record = logging.LogRecord("ns0", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampling_filter_limits_bursts_and_reports_suppressed(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(logs.time, "monotonic", lambda: now[0])
+    reports = []
+    sampling = logs.SamplingFilter(interval=60, burst=2, emit=reports.append)
+
+    passed = [sampling.filter(_record("Record %s expired")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    # Other messages and lower levels have their own budget
+    assert sampling.filter(_record("Record %s created"))
+    assert sampling.filter(_record("Record %s expired", logging.INFO))
+    assert reports == []
+
+    # The count is reported once the window closes, by the next record logged
+    now[0] = 60.0
+    assert sampling.filter(_record("Cycle %s", logging.DEBUG, (1,)))
+    assert [report.suppressed for report in reports] == [3]
+    assert reports[0].getMessage() == (
+        "Record web.ns0.co expired (3 similar messages suppressed)"
+    )
+
+
+def test_sampling_filter_passes_distinct_errors(monkeypatch):
+    monkeypatch.setattr(logs.time, "monotonic", lambda: 0.0)
+    reports = []
+    sampling = logs.SamplingFilter(interval=60, burst=1, emit=reports.append)
+    message = "%s: failed to update Record %s with Lexicon: %s"
+
+    for hostname in ("h1", "h2", "h3"):
+        assert sampling.filter(_record(message, logging.ERROR, ("mock", hostname, 1)))
+    assert not sampling.filter(_record(message, logging.ERROR, ("mock", "h3", 1)))
+    assert sampling.filter(_record("%s", exc_info=(None, None, None)))
+    assert sampling.filter(_record("%s", exc_info=(None, None, None)))
+    assert sampling.filter(_record("Skipping %s", sample=False))
+    assert sampling.filter(_record("Skipping %s", sample=False))
+
+    sampling.flush()
+    assert [report.getMessage() for report in reports] == [
+        "mock: failed to update Record h3 with Lexicon: 1 "
+        "(1 similar messages suppressed)"
+    ]
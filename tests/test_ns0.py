@@ -0,0 +1,181 @@
+import datetime
+import threading
+import types
+
+import churn
+import ns0 as ns0_module
+import pytest
+from ns0 import NS0
+
+
+@pytest.fixture
+def ns0(tmp_path):
+    instance = churn.ReplayNS0(datetime.datetime.now, str(tmp_path))
+    yield instance
+    instance.close()
+
+
+def _record(hostname, endpoints, source_id="1"):
+    return {
+        hostname: {
+            "hostname": hostname,
+            "endpoints": endpoints,
+            "sources": [{"name": "web", "type": "docker", "id": source_id}],
+        }
+    }
+
+
+def test_index_follows_updates(ns0):
+    ns0.createRecords(_record("web.ns0.co", ["public"]))
+    ns0.flush()
+    ns0.createRecords(_record("web.ns0.co", ["zerotier"]))
+
+    assert ns0.index.get("web.ns0.co") == ns0.records["web.ns0.co"]
+    assert ns0.index.get("web.ns0.co")["endpoints"] == ("zerotier",)
+
+
+def test_sync_zones_groups_indexed_hostnames(ns0):
+    ns0.createRecords(_record("a.ns0.co", ["public"]))
+    ns0.createRecords(_record("b.example.com", ["public"]))
+    ns0.guessZone("a.ns0.co")
+    ns0.guessZone("b.example.com")
+    ns0.guessZone = None  # Indexed hostnames need no guessing
+
+    assert ns0.flush(workers=2) is False
+    assert ns0.records["a.ns0.co"]["values"]
+    assert ns0.records["b.example.com"]["values"]
+
+
+def test_apply_publishes_once(ns0):
+    for i in range(3):
+        ns0.createRecords(_record("web{}.ns0.co".format(i), ["public"]))
+    version = ns0.records.version
+
+    assert ns0.flush() is False
+    assert ns0.records.version == version + 1
+    assert all(ns0.records["web{}.ns0.co".format(i)]["values"] for i in range(3))
+
+
+def test_provider_change_resends_the_published_record_set(ns0):
+    ns0.createRecords(_record("web.ns0.co", ["public"]))
+    ns0.flush()
+    published = ns0.records["web.ns0.co"]["values"]
+
+    assert ns0.reconfigure({"ns0:mock:auth_token"}) == ["web.ns0.co"]
+    assert ns0.records["web.ns0.co"]["values"] == published
+    op = ns0.queue.get("web.ns0.co")
+    assert op["create"] == list(published)
+    assert op["delete"] == []
+
+
+def test_endpoint_changes_are_diffed_against_the_published_values(ns0):
+    ns0.createRecords(_record("web.ns0.co", ["public", "zerotier"]))
+    ns0.flush()
+    public = set(ns0.resolveValues(["public"]))
+    private = set(ns0.resolveValues(["private"]))
+    zerotier = set(ns0.resolveValues(["zerotier"]))
+    assert ns0.supervisor.state["web.ns0.co"] == public | zerotier
+
+    ns0.createRecords(_record("web.ns0.co", ["zerotier", "private"]))
+    op = ns0.queue.get("web.ns0.co")
+    assert (set(op["create"]), set(op["delete"])) == (private, public)
+
+    # A later change supersedes the pending operation, still diffed against
+    # the published values, and changing back leaves nothing to send
+    ns0.createRecords(_record("web.ns0.co", ["zerotier"]))
+    op = ns0.queue.get("web.ns0.co")
+    assert (op["create"], set(op["delete"])) == ([], public)
+    ns0.createRecords(_record("web.ns0.co", ["public", "zerotier"]))
+    op = ns0.queue.get("web.ns0.co")
+    assert (op["create"], op["delete"]) == ([], [])
+
+    calls = ns0.supervisor.calls
+    ns0.flush()
+    assert ns0.supervisor.calls == calls
+    assert ns0.supervisor.state["web.ns0.co"] == public | zerotier
+
+
+def test_provider_options_from_the_config_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("LEXICON_CLOUDFLARE_AUTH_TOKEN", raising=False)
+    (tmp_path / "ns0.yml").write_text(
+        "negative_ttl:\n  no_zone: 0\ncloudflare:\n  auth_token: SECRET_TOKEN\n"
+    )
+    instance = churn.ReplayNS0(datetime.datetime.now, str(tmp_path))
+    try:
+        assert instance.negative.ttls["no_zone"] == 0
+        assert NS0.hasAuthToken(instance, "cloudflare")
+        assert not NS0.hasAuthToken(instance, "route53")
+    finally:
+        instance.close()
+
+
+def test_guessed_providers_expire(ns0, monkeypatch):
+    queries = []
+
+    def query(zone, type):
+        queries.append(zone)
+        return [types.SimpleNamespace(target="ns1.cloudflare.com.")]
+
+    monkeypatch.setattr(ns0_module.dns.resolver, "query", query)
+    monkeypatch.setattr(
+        ns0_module.discovery, "find_providers", lambda: {"cloudflare": object()}
+    )
+
+    assert NS0.guessProvider(ns0, "web.ns0.co") == ["cloudflare"]
+    assert NS0.guessProvider(ns0, "api.ns0.co") == ["cloudflare"]
+    assert queries == ["ns0.co"]
+
+    providers, _ = ns0.zone_providers["ns0.co"]
+    ns0.zone_providers["ns0.co"] = (providers, 0)
+    assert NS0.guessProvider(ns0, "web.ns0.co") == ["cloudflare"]
+    assert queries == ["ns0.co", "ns0.co"]
+
+
+def test_published_state_survives_a_restart(tmp_path, monkeypatch):
+    monkeypatch.setenv("NS0_JOURNAL_PATH", str(tmp_path / "ns0.journal"))
+    instance = churn.ReplayNS0(datetime.datetime.now, str(tmp_path))
+    instance.createRecords(_record("web.ns0.co", ["public"]))
+    instance.flush()
+    published = instance.records["web.ns0.co"]["values"]
+    instance.close()
+
+    restarted = churn.ReplayNS0(datetime.datetime.now, str(tmp_path))
+    try:
+        assert restarted.records["web.ns0.co"]["values"] == published
+        assert restarted.index.get("web.ns0.co") == restarted.records["web.ns0.co"]
+        # Nothing changed, so nothing is sent to the provider again
+        restarted.createRecords(_record("web.ns0.co", ["public"]))
+        assert len(restarted.queue) == 0
+    finally:
+        restarted.close()
+
+
+class _OutageSupervisor(churn.MockSupervisor):
+    """Provider 'down' hangs until provider 'up' has been called"""
+
+    def __init__(self):
+        super(_OutageSupervisor, self).__init__()
+        self.up = threading.Event()
+        self.waited = []
+
+    def execute_rrset(self, provider_name, domain, name, changes):
+        if provider_name == "down":
+            self.waited.append(self.up.wait(5))
+            return False
+        self.up.set()
+        return super(_OutageSupervisor, self).execute_rrset(
+            provider_name, domain, name, changes
+        )
+
+
+def test_providers_are_synced_concurrently(ns0):
+    ns0.supervisor = _OutageSupervisor()
+    for hostname, provider_name in (("a.ns0.co", "down"), ("b.ns0.co", "up")):
+        record = _record(hostname, ["public"])
+        record[hostname]["provider"] = provider_name
+        ns0.createRecords(record)
+
+    assert ns0.flush() is True
+    assert ns0.supervisor.waited == [True]
+    assert ns0.records["b.ns0.co"]["values"]
+    assert not ns0.records["a.ns0.co"]["values"]
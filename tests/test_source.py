@@ -0,0 +1,25 @@
+from providers.source import RecordSource
+
+
+class StaticSource(RecordSource):
+    def __init__(self, records):
+        super(StaticSource, self).__init__()
+        self.records = records
+
+    def snapshot(self):
+        return dict(self.records)
+
+
+def test_changes_are_computed_from_snapshots():
+    source = StaticSource({"a": {"hostname": "a.ns0.co"}})
+    first = source.changes()
+    assert first == (1, {"a": {"hostname": "a.ns0.co"}}, [], True)
+
+    source.records = {"b": {"hostname": "b.ns0.co"}}
+    second = source.changes(first.seq)
+    assert second == (2, {"b": {"hostname": "b.ns0.co"}}, ["a"], False)
+
+    # Nothing changed, the sequence number stays the same
+    assert source.changes(second.seq) == (2, {}, [], False)
+    # Consumers that are out of step get the full state
+    assert source.changes(first.seq) == (2, {"b": {"hostname": "b.ns0.co"}}, [], True)
@@ -0,0 +1,51 @@
+import pytest
+import store
+from store import RecordStore
+
+
+def test_buckets_grow_with_the_store():
+    records = RecordStore(buckets=2)
+    with records.transaction() as txn:
+        for i in range(4 * store.BUCKET_SIZE + 1):
+            txn.set("web{}.ns0.co".format(i), {"values": [i]})
+
+    snapshot = records.snapshot()
+    assert len(snapshot._buckets) == 8
+    assert len(snapshot) == 4 * store.BUCKET_SIZE + 1
+    assert snapshot["web7.ns0.co"]["values"] == (7,)
+    assert sorted(snapshot) == sorted(
+        "web{}.ns0.co".format(i) for i in range(4 * store.BUCKET_SIZE + 1)
+    )
+
+
+def test_snapshots_are_isolated_from_writes():
+    records = RecordStore({"web.ns0.co": {"values": [1]}})
+    before = records.snapshot()
+
+    with records.transaction() as txn:
+        txn.update("web.ns0.co", values=[2])
+        txn.set("api.ns0.co", {"values": [3]})
+        # Readers don't see the transaction before it is published
+        assert records["web.ns0.co"]["values"] == (1,)
+        assert "api.ns0.co" not in records
+    records.delete("web.ns0.co")
+
+    assert dict(before) == {"web.ns0.co": {"values": (1,)}}
+    assert before.version + 2 == records.version
+    assert dict(records) == {"api.ns0.co": {"values": (3,)}}
+
+
+def test_records_are_frozen_deeply():
+    sources = [{"name": "web", "type": "docker", "id": "1"}]
+    records = RecordStore({"web.ns0.co": {"sources": sources, "values": [("A", "1")]}})
+    sources.append({"name": "api", "type": "docker", "id": "2"})
+    record = records["web.ns0.co"]
+
+    assert record["sources"] == ({"name": "web", "type": "docker", "id": "1"},)
+    assert record["values"] == (("A", "1"),)
+    with pytest.raises(TypeError):
+        record["values"] = ()
+    with pytest.raises(AttributeError):
+        record["sources"].append({})
+    with pytest.raises(TypeError):
+        record["sources"][0]["id"] = "2"
@@ -0,0 +1,56 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+import supervisor
+from supervisor import CircuitBreaker, ProviderPool
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return True
+
+
+def test_timeout_spares_concurrent_calls():
+    pool = ProviderPool("mock", workers=2)
+    results = []
+    healthy = threading.Thread(
+        target=lambda: results.append(pool.execute(_sleep, 1, 5))
+    )
+    try:
+        healthy.start()
+        with pytest.raises(multiprocessing.TimeoutError):
+            pool.execute(_sleep, 3, 0.5)
+        healthy.join()
+        assert results == [True]
+        # New calls run in fresh workers
+        assert pool.execute(_sleep, 0, 5) is True
+    finally:
+        pool.close()
+
+
+def test_circuit_breaker_opens_half_opens_and_closes(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(supervisor.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+
+    breaker.failure()
+    assert breaker.allow() and breaker.state == CircuitBreaker.CLOSED
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    # A single trial call after the reset timeout, failing opens it again
+    now[0] = 60.0
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    now[0] = 120.0
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.failures == 0
@@ -0,0 +1,23 @@
+import os
+import time
+
+import watch
+from watch import DirectoryWatcher
+
+
+def test_polling_waits_for_recent_writes_to_settle(tmp_path, monkeypatch):
+    monkeypatch.setattr(watch, "INotify", None)
+    old = tmp_path / "old.yml"
+    recent = tmp_path / "recent.yml"
+    watcher = DirectoryWatcher(str(tmp_path), r"\.yml$")
+
+    old.write_text("a: 1\n")
+    os.utime(str(old), ns=(time.time_ns() - 10 ** 10,) * 2)
+    recent.write_text("a: 1\n")
+    assert watcher.changes() == {str(old)}
+    # Unchanged since the previous scan
+    assert watcher.changes() == {str(recent)}
+
+    old.unlink()
+    assert watcher.changes() == {str(old)}
+    assert watcher.paths() == [str(recent)]
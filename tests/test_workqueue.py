@@ -0,0 +1,48 @@
+from workqueue import OperationQueue, kind
+
+
+def _op(hostname, create=(), delete=(), action="update"):
+    return {
+        "action": action,
+        "hostname": hostname,
+        "create": list(create),
+        "delete": list(delete),
+    }
+
+
+def test_newer_operations_supersede_pending_ones():
+    queue = OperationQueue()
+    queue.push(_op("web.ns0.co", create=[("A", "192.0.2.1")]))
+    queue.push(_op("web.ns0.co", create=[("A", "192.0.2.2")]))
+
+    assert len(queue) == 1
+    assert queue.superseded == 1
+    assert list(queue.drain()) == [_op("web.ns0.co", create=[("A", "192.0.2.2")])]
+    assert len(queue) == 0
+
+
+def test_create_undoing_a_pending_delete_collapses_into_a_noop():
+    queue = OperationQueue()
+    queue.push(_op("web.ns0.co", delete=[("A", "192.0.2.1")]))
+    # Planned against the same published values, nothing to change anymore
+    queue.push(_op("web.ns0.co"))
+
+    op = queue.get("web.ns0.co")
+    assert kind(op) == "noop"
+
+
+def test_operations_are_drained_by_priority():
+    queue = OperationQueue("delete,withdraw,update,create")
+    queue.push(_op("create.ns0.co", create=[("A", "192.0.2.1")]))
+    queue.push(_op("update.ns0.co", create=[("A", "1")], delete=[("A", "2")]))
+    queue.push(_op("delete.ns0.co", delete=[("A", "1")], action="delete"))
+    queue.push(_op("noop.ns0.co"))
+    queue.push(_op("withdraw.ns0.co", delete=[("A", "1")]))
+
+    assert [op["hostname"] for op in queue.drain()] == [
+        "noop.ns0.co",
+        "delete.ns0.co",
+        "withdraw.ns0.co",
+        "update.ns0.co",
+        "create.ns0.co",
+    ]
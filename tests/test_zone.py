@@ -0,0 +1,72 @@
+import io
+
+import pytest
+from config import ConfigResolver
+from providers.file import FileSource
+from providers.zonefile import parse_bind_lines
+from zone import import_zone
+
+
+def test_indented_first_record_is_skipped():
+    stream = io.StringIO(
+        "$ORIGIN ns0.co.\n"
+        "\t300\tIN\tA\t192.0.2.1\n"
+        "web\t300\tIN\tA\t192.0.2.2\n"
+        "\t300\tIN\tAAAA\t2001:db8::2\n"
+    )
+    assert list(parse_bind_lines(stream)) == [
+        ("web.ns0.co", "A", "192.0.2.2", ""),
+        ("web.ns0.co", "AAAA", "2001:db8::2", ""),
+    ]
+
+
+def test_import_hands_the_zone_to_the_records_dir(tmp_path):
+    records_dir = tmp_path / "records"
+    records_dir.mkdir()
+    zone = tmp_path / "ns0.zone"
+    zone.write_text(
+        "; Exported by ns0\n"
+        "web.ns0.co.\t0\tIN\tA\t192.0.2.2\t; ns0 endpoints=public provider=mock\n"
+        "api.ns0.co.\t0\tIN\tA\t10.0.0.2\n"
+        "old.ns0.co.\t0\tIN\tA\t198.51.100.1\n"
+    )
+    endpoints = {"public": {"ipv4": "192.0.2.2"}, "local": {"ipv4": "10.0.0.2"}}
+    config = ConfigResolver().with_dict(
+        {"records_dir": str(records_dir), "endpoints": endpoints}
+    )
+
+    # Records without an Endpoint announcing their values are skipped
+    assert import_zone(config, str(zone)) == 2
+    assert sorted(path.name for path in records_dir.iterdir()) == ["ns0.zone"]
+
+    source = FileSource(str(records_dir), endpoints=lambda: endpoints)
+    records = source.changes().records
+    path = str(records_dir / "ns0.zone")
+    assert records == {
+        "{}:web.ns0.co".format(path): {
+            "hostname": "web.ns0.co",
+            "endpoints": ["public"],
+            "provider": "mock",
+            "sources": [{"name": "file", "type": "file", "id": path}],
+        },
+        "{}:api.ns0.co".format(path): {
+            "hostname": "api.ns0.co",
+            "endpoints": ["local"],
+            "sources": [{"name": "file", "type": "file", "id": path}],
+        },
+    }
+    source.close()
+
+
+def test_import_needs_a_records_dir_and_a_valid_zone(tmp_path):
+    records_dir = tmp_path / "records"
+    records_dir.mkdir()
+    zone = tmp_path / "ns0.ndjson"
+    zone.write_text('{"hostname": "web.ns0.co"}\n')
+
+    with pytest.raises(ValueError):
+        import_zone(ConfigResolver(), str(zone))
+    config = ConfigResolver().with_dict({"records_dir": str(records_dir)})
+    with pytest.raises(KeyError):
+        import_zone(config, str(zone))
+    assert list(records_dir.iterdir()) == []